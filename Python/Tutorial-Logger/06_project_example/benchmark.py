@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+'''
+Benchmarks for the logger utility module.
+
+Run as
+>> python3 benchmark.py            # Run all benchmarks
+>> python3 benchmark.py async      # Run a single benchmark
+
+Console output from the project logger is sent to /dev/null and file output to
+a temporary directory so only the logging overhead is measured.
+'''
+import argparse
+import contextlib
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import logger
+
+################################################################################
+# Benchmarks
+def benchmark_async(n_calls: int = 20_000):
+    '''p50/p99 latency of log.info() with basic_config(async_=False/True)
+
+    The async queue blocks when full (on_full='block') so every call is a real
+    enqueue. With the default 'drop' policy dropped calls would be cheap and
+    flatter the timings.
+    '''
+    print(f'log.info() call latency over {n_calls} calls')
+    for async_ in (False, True):
+        with tempfile.TemporaryDirectory() as tmpdir, devnull_stdout():
+            log = reset_project_logger()
+            logger.basic_config(
+                level='INFO', log_path=Path(tmpdir), async_=async_, on_full='block'
+            )
+            durations = time_calls(log.info, n_calls)
+            n_dropped = sum(getattr(h, 'n_dropped', 0) for h in log.handlers)
+            reset_project_logger()
+        print(f'  async_={async_!s:5} : {latency_summary_str(durations)}; dropped = {n_dropped}')
+
+def benchmark_buffered_file(n_records: int = 200_000):
+    '''Records/sec written by FileHandler vs BufferedFileHandler'''
+    print(f'File handler throughput over {n_records} records')
+    handler_classes = (logging.FileHandler, logger.BufferedFileHandler)
+    for handler_class in handler_classes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = handler_class(Path(tmpdir) / 'bench.log')
+            handler.setFormatter(logging.Formatter(logger.LOG_FMT_DEFAULT))
+            handler.addFilter(logger.RecordAttributeAdder())
+            log = isolated_logger('BENCH.file', handler)
+            start = time.perf_counter()
+            for i in range(n_records):
+                log.info('Benchmark message %d', i)
+            handler.close()
+            duration = time.perf_counter() - start
+            log.removeHandler(handler)
+        print(f'  {handler_class.__name__:20} : {n_records/duration:10,.0f} records/s')
+
+def benchmark_formatter(n_records: int = 200_000):
+    '''Filter + format time of the stock Formatter vs CompiledFormatter'''
+    print(f'Filter + format time per record over {n_records} records')
+    records = [
+        logging.LogRecord(
+            f'{logger.PROJECT_LOGGER_NAME}.module{i % 50}.Class{i % 7}',
+            logging.INFO, __file__, i, 'Benchmark message %d', (i,), None,
+        )
+        for i in range(n_records)
+    ]
+
+    # Baseline is the original uncached filter with the stock Formatter
+    def uncached_filter(record):
+        record.name_last = record.name.rsplit('.', 1)[-1]
+        return True
+
+    candidates = {
+        'Formatter'         : (uncached_filter, logging.Formatter(logger.LOG_FMT_DEFAULT)),
+        'CompiledFormatter' : (logger.RecordAttributeAdder().filter, logger.CompiledFormatter(logger.LOG_FMT_DEFAULT)),
+    }
+    for name, (record_filter, formatter) in candidates.items():
+        start = time.perf_counter_ns()
+        for record in records:
+            record_filter(record)
+            formatter.format(record)
+        duration = time.perf_counter_ns() - start
+        print(f'  {name:20} : {duration / n_records:7.1f}ns/record')
+
+def benchmark_hierarchy_summary(n_loggers: int = 10_000):
+    '''log_hierarchy_summary_str time with many loggers (cold and cached)'''
+    print(f'log_hierarchy_summary_str time with {n_loggers} synthetic loggers')
+    for i in range(n_loggers):
+        logger.get_logger(f'bench.module{i // 100}.Class{i % 100}')
+
+    start = time.perf_counter()
+    expected = log_hierarchy_summary_str_baseline()
+    duration_baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = logger.log_hierarchy_summary_str()
+    duration_cold = time.perf_counter() - start
+    assert result == expected, 'Summary differs from baseline'
+
+    start = time.perf_counter()
+    logger.log_hierarchy_summary_str()
+    duration_cached = time.perf_counter() - start
+
+    print(f'  {"Baseline":20} : {duration_baseline*10**3:8.1f}ms')
+    print(f'  {"Single pass (cold)":20} : {duration_cold*10**3:8.1f}ms')
+    print(f'  {"Single pass (cached)":20} : {duration_cached*10**3:8.1f}ms')
+
+def log_hierarchy_summary_str_baseline() -> str:
+    '''Original two pass implementation of logger.log_hierarchy_summary_str'''
+    ostr = 'Logger Hierarchy\n'
+    for name in ['root'] + sorted(logging.root.manager.loggerDict):
+        if name == 'root':
+            name_last = name
+            depth = 0
+        else:
+            parts = name.split('.')
+            name_last = parts[-1]
+            depth = len(parts)
+        if depth > 1 and not name.startswith(logger.PROJECT_LOGGER_NAME):
+            continue
+        tabs = '  ' * depth
+        log = logging.getLogger(name)
+        attr_str = f'lvl={logger.level_name(log.level)}'
+        attr_str += f'; n_handlers={len(log.handlers)}'
+        attr_str += f'; propogate={log.propagate}'
+        ostr += f'{tabs}- {name_last} [{attr_str}]\n'
+    ostr += 'Logger Info\n'
+    for name in ['root'] + sorted(logging.root.manager.loggerDict):
+        log = logging.getLogger(name)
+        ostr += log_summary_str_baseline(log) + '\n'
+    return ostr
+
+def log_summary_str_baseline(log: logging.Logger) -> str:
+    '''Original implementation of logger.log_summary_str'''
+    log_lvl = log.level
+    eff_lvl = log.getEffectiveLevel()
+    enabled_lvls = [lvl for lvl  in range(logging.CRITICAL+1) if log.isEnabledFor(lvl)]
+    min_lvl = min(enabled_lvls) if enabled_lvls else None
+
+    s  = f'Log Summary - {log.name}'
+    s += f'\n - Levels   : Effective = {logger.level_name(eff_lvl)}; Logger = {logger.level_name(log_lvl)}; Enabled for >={logger.level_name(min_lvl)}'
+    s += f'\n - Flags    : Disabled = {log.disabled}'
+    s += f', Propogate = {log.propagate}'
+    s += f', Handlers = {log.hasHandlers()}'
+    for i, hndl in enumerate(log.handlers,1):
+        s += f'\n - Handler {i}: {hndl}'
+    for i, fltr in enumerate(log.filters,1):
+        s += f'\n - Filter {i} : {fltr}'
+    return s
+
+BENCHMARKS = {
+    'async'         : benchmark_async,
+    'buffered_file' : benchmark_buffered_file,
+    'formatter'     : benchmark_formatter,
+    'hierarchy'     : benchmark_hierarchy_summary,
+}
+
+################################################################################
+# Utilities
+@contextlib.contextmanager
+def devnull_stdout():
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def reset_project_logger() -> logging.Logger:
+    '''Remove (and stop) all project logger handlers so it can be reconfigured'''
+    log = logging.getLogger(logger.PROJECT_LOGGER_NAME)
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        if getattr(handler, 'listener', None) is not None:
+            handler.listener.stop()
+        handler.close()
+    return log
+
+def isolated_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    log = logging.getLogger(name)
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    return log
+
+def time_calls(log_call, n_calls: int) -> list[int]:
+    durations = []
+    for i in range(n_calls):
+        start = time.perf_counter_ns()
+        log_call('Benchmark message %d', i)
+        durations.append(time.perf_counter_ns() - start)
+    return durations
+
+def percentile(values: list[int], pct: float) -> float:
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
+
+def latency_summary_str(durations: list[int]) -> str:
+    p50 = percentile(durations, 50) / 10**3
+    p99 = percentile(durations, 99) / 10**3
+    return f'p50 = {p50:7.2f}us; p99 = {p99:7.2f}us'
+
+################################################################################
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'benchmarks',
+        nargs = '*',
+        help  = f'Benchmarks to run (default: all). Options: {", ".join(BENCHMARKS)}',
+    )
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'Unknown benchmark(s): {", ".join(sorted(unknown))}')
+    return args
+
+def main():
+    args = get_args()
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main()
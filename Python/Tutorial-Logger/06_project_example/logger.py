@@ -1,9 +1,28 @@
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import gzip
+import json
+from json.encoder import encode_basestring
 import logging
+from logging.handlers import BaseRotatingHandler, QueueHandler, QueueListener
+from operator import attrgetter
 from pathlib import Path
+import os
+import queue
+import re
+import shutil
+import threading
 import time
-from traceback import TracebackException
+from traceback import TracebackException, print_exc
 import sys
-from typing import Union, Optional
+from typing import Callable, Iterator, Union, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 ################################################################################
 # Configuration
@@ -26,12 +45,47 @@ LOG_FMT_DEFAULT ='%(levelname)8s | %(name_last)s :: %(message)s'
 # like hasHandlers are not effected by root logger)
 logging.getLogger(PROJECT_LOGGER_NAME).propagate = False
 
-def basic_config(level: Union[int,str] = None, log_path: Path = None):
+# Record attributes written by JsonLinesFormatter
+JSON_FIELDS_DEFAULT = ('created', 'levelname', 'name', 'message')
+
+# Max number of logger names with a cached name_last (see RecordAttributeAdder)
+NAME_LAST_CACHE_SIZE = 1024
+
+# RateLimitFilter defaults
+RATE_LIMIT_PER_S_DEFAULT = 10
+RATE_LIMIT_BURST_DEFAULT = 20
+RATE_LIMIT_MAX_KEYS_DEFAULT = 10_000
+
+# Async (queue-backed) logging defaults
+ASYNC_QUEUE_SIZE_DEFAULT = 10_000
+ASYNC_ON_FULL_DEFAULT = 'drop' # 'drop' or 'block'
+
+# Buffered log file defaults
+BUFFER_FLUSH_BYTES_DEFAULT = 64 * 1024
+BUFFER_FLUSH_INTERVAL_MS_DEFAULT = 1000
+BUFFER_FLUSH_LEVEL_DEFAULT = logging.ERROR
+
+# Rotating log file defaults
+ROTATE_COMPRESSION_DEFAULT = 'gzip' # 'gzip', 'zstd', or None
+ROTATE_BACKUP_COUNT_DEFAULT = 10
+
+# Max length of a buffered partial line before it is logged anyway (bytes for
+# FdCapture, characters for LoggerWriter)
+MAX_LINE_LEN_DEFAULT = 64 * 1024
+
+def basic_config(
+    level: Union[int,str] = None,
+    log_path: Path = None,
+    async_: bool = False,
+    queue_size: int = ASYNC_QUEUE_SIZE_DEFAULT,
+    on_full: str = ASYNC_ON_FULL_DEFAULT,
+    rate_limit: bool = False,
+):
     log = logging.getLogger(PROJECT_LOGGER_NAME)
     if log.hasHandlers():
         log.warning('Project logger already configured: %s', PROJECT_LOGGER_NAME)
         return
-    formatter = logging.Formatter(LOG_FMT_DEFAULT)
+    formatter = CompiledFormatter(LOG_FMT_DEFAULT)
     handler = logging.StreamHandler(stream=sys.stdout)
     handler.setFormatter(formatter)
     handler.addFilter(RecordAttributeAdder())
@@ -46,6 +100,18 @@ def basic_config(level: Union[int,str] = None, log_path: Path = None):
         log.setLevel(level)
     if log_path:
         add_log_file(log, log_path)
+    if rate_limit:
+        # On the handlers so records from child loggers are limited too
+        rate_limit_filter = RateLimitFilter()
+        for log_handler in log.handlers:
+            log_handler.addFilter(rate_limit_filter)
+    if async_:
+        # Move handlers configured above behind a queue so log calls only pay
+        # for enqueueing the record
+        enable_async_logging(log, queue_size, on_full)
+    if rate_limit and not async_:
+        # The async listener closes it once the queue is drained
+        atexit.register(rate_limit_filter.close)
     redirect_exceptions_to_logger(log)
     # Use at your own risk. See function docstring for warnings
     #capture_python_stdout(log)
@@ -89,35 +155,73 @@ def level_name(level: Optional[int]) -> str:
         name += f'+{sublevel}'
     return name
 
+# Cached (manager state key, summary string) for log_hierarchy_summary_str
+_hierarchy_summary_cache = (None, '')
+
 def log_hierarchy_summary_str() -> str:
-    ostr = 'Logger Hierarchy\n'
-    for name in ['root'] + sorted(logging.root.manager.loggerDict):
+    '''Summary of all loggers, cached until the logger manager changes
+
+    The cache is invalidated when loggers are created or when any logger's
+    level, flags, handlers, or filters change.
+    '''
+    global _hierarchy_summary_cache
+    manager = logging.root.manager
+    loggers = [('root', logging.root)]
+    for name, log in sorted(manager.loggerDict.items()):
+        if not isinstance(log, logging.Logger):
+            # PlaceHolder for a parent of a logger that has not been created
+            log = logging.getLogger(name)
+        loggers.append((name, log))
+
+    key = (manager.disable, tuple(_log_state(log) for _, log in loggers))
+    cached_key, cached_str = _hierarchy_summary_cache
+    if key == cached_key:
+        return cached_str
+
+    hierarchy_lines = ['Logger Hierarchy']
+    info_lines = ['Logger Info']
+    for name, log in loggers:
+        info_lines.append(log_summary_str(log))
         if name == 'root':
             name_last = name
             depth = 0
         else:
-            parts = name.split('.')
-            name_last = parts[-1]
-            depth = len(parts)
-        if depth > 1 and not name.startswith(PROJECT_LOGGER_NAME):
-            continue
+            depth = name.count('.') + 1
+            if depth > 1 and not name.startswith(PROJECT_LOGGER_NAME):
+                continue
+            name_last = name.rsplit('.', 1)[-1]
         tabs = '  ' * depth
-        log = logging.getLogger(name)
         attr_str = f'lvl={level_name(log.level)}'
         attr_str += f'; n_handlers={len(log.handlers)}'
         attr_str += f'; propogate={log.propagate}'
-        ostr += f'{tabs}- {name_last} [{attr_str}]\n'
-    ostr += 'Logger Info\n'
-    for name in ['root'] + sorted(logging.root.manager.loggerDict):
-        log = logging.getLogger(name)
-        ostr += log_summary_str(log) + '\n'
+        hierarchy_lines.append(f'{tabs}- {name_last} [{attr_str}]')
+    ostr = '\n'.join(hierarchy_lines + info_lines) + '\n'
+
+    _hierarchy_summary_cache = (key, ostr)
     return ostr
 
+def _log_state(log: logging.Logger) -> tuple:
+    '''Everything about a logger that log_summary_str reports on'''
+    return (
+        id(log),
+        log.level,
+        log.disabled,
+        log.propagate,
+        # repr shows the level and stream/file (e.g. after setStream)
+        tuple((id(h), repr(h)) for h in log.handlers),
+        tuple(map(id, log.filters)),
+    )
+
 def log_summary_str(log):
     log_lvl = log.level
     eff_lvl = log.getEffectiveLevel()
-    enabled_lvls = [lvl for lvl  in range(logging.CRITICAL+1) if log.isEnabledFor(lvl)]
-    min_lvl = min(enabled_lvls) if enabled_lvls else None
+    # Lowest level passing isEnabledFor(), computed without probing every level
+    if log.disabled:
+        min_lvl = None
+    else:
+        min_lvl = max(eff_lvl, log.manager.disable + 1)
+        if min_lvl > logging.CRITICAL:
+            min_lvl = None
 
     s  = f'Log Summary - {log.name}'
     s += f'\n - Levels   : Effective = {level_name(eff_lvl)}; Logger = {level_name(log_lvl)}; Enabled for >={level_name(min_lvl)}'
@@ -138,24 +242,536 @@ def log_multiline(log_call, txt):
 
 ################################################################################
 # Configuration utilities
-def add_log_file(logger, path: Path = Path('./')) -> Path:
-    formatter = logging.Formatter(LOG_FMT_DEFAULT)
+def add_log_file(
+    logger,
+    path: Path = Path('./'),
+    buffered: bool = False,
+    max_bytes: int = 0,
+    rotate_interval_s: float = 0,
+    json_lines: bool = False,
+) -> Path:
+    '''Add file handler to logger
+
+    Set max_bytes and/or rotate_interval_s to rotate the log file, compressing
+    old segments in the background (see CompressingRotatingFileHandler).
+    Set json_lines to write one JSON object per record instead of text (see
+    JsonLinesFormatter and read_json_lines).
+    '''
+    if json_lines:
+        formatter = JsonLinesFormatter()
+    else:
+        formatter = CompiledFormatter(LOG_FMT_DEFAULT)
     if path.is_dir():
         path = path / f'run_{time.strftime("%Y%m%d_%H%M%S_%Z")}.log'
+    rotate = max_bytes > 0 or rotate_interval_s > 0
+    if buffered and rotate:
+        raise ValueError('Buffered log files do not support rotation')
     logger.info("Adding log file: %s", path)
-    file_handler = logging.FileHandler(path)
+    if buffered:
+        file_handler = BufferedFileHandler(path)
+    elif rotate:
+        file_handler = CompressingRotatingFileHandler(
+            path, max_bytes=max_bytes, interval_s=rotate_interval_s
+        )
+    else:
+        file_handler = logging.FileHandler(path)
     file_handler.setFormatter(formatter)
+    file_handler.addFilter(RecordAttributeAdder())
     logger.addHandler(file_handler)
 
     return path
 
+class BufferedFileHandler(logging.FileHandler):
+    '''FileHandler that groups formatted records into large writes
+
+    The stock FileHandler flushes after every record. Here records are buffered
+    and written in one go when any of the following happen
+    - flush_bytes characters of formatted output have accumulated
+    - flush_interval_ms has passed since the last flush (checked by a
+      background thread so quiet loggers still get written out)
+    - a record at flush_level or above arrives (e.g. ERROR)
+    - flush() or close() is called (e.g. by logging.shutdown at exit)
+    '''
+    def __init__(
+        self,
+        filename,
+        mode: str = 'a',
+        encoding: str = None,
+        delay: bool = False,
+        flush_bytes: int = BUFFER_FLUSH_BYTES_DEFAULT,
+        flush_interval_ms: float = BUFFER_FLUSH_INTERVAL_MS_DEFAULT,
+        flush_level: int = BUFFER_FLUSH_LEVEL_DEFAULT,
+    ):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_level = flush_level
+        self._buffer = []
+        self._buffer_size = 0
+        self._last_flush = time.monotonic()
+        super().__init__(filename, mode=mode, encoding=encoding, delay=delay)
+
+        self._stop_flushing = threading.Event()
+        self._flush_thread = threading.Thread(
+            target=self._flush_periodically, name='BufferedFileHandler', daemon=True
+        )
+        self._flush_thread.start()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            msg = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+        self._buffer.append(msg)
+        self._buffer_size += len(msg)
+        if (
+            self._buffer_size >= self.flush_bytes
+            or record.levelno >= self.flush_level
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            if self.stream is None:
+                # Opening delayed until first write
+                self.stream = self._open()
+            self.stream.write(''.join(self._buffer))
+            self.stream.flush()
+            self._buffer.clear()
+            self._buffer_size = 0
+
+    def close(self):
+        self._stop_flushing.set()
+        self.flush()
+        super().close()
+
+    def _flush_periodically(self):
+        while not self._stop_flushing.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+class CompressingRotatingFileHandler(BaseRotatingHandler):
+    '''Log file rotated by size and/or time with compressed, capped backups
+
+    The file is rotated once it reaches max_bytes or interval_s seconds after
+    it was opened (0 disables either trigger). Rotated segments are renamed to
+    '<filename>.<timestamp>' and then compressed (gzip or zstd) on a single
+    background thread so the logging thread only pays for a rename. Once a
+    segment is compressed, the oldest segments beyond backup_count are deleted.
+
+    NOTES/WARNINGS
+    - zstd compression requires the optional zstandard package
+    - close() waits for pending compression jobs (logging.shutdown does this
+      at exit)
+    '''
+    def __init__(
+        self,
+        filename,
+        max_bytes: int = 0,
+        interval_s: float = 0,
+        compression: Optional[str] = ROTATE_COMPRESSION_DEFAULT,
+        backup_count: int = ROTATE_BACKUP_COUNT_DEFAULT,
+        encoding: str = None,
+        delay: bool = False,
+    ):
+        if compression not in ('gzip', 'zstd', None):
+            raise ValueError(f'Unknown compression: {compression!r}')
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression requires the zstandard package')
+        super().__init__(filename, mode='a', encoding=encoding, delay=delay)
+        self.max_bytes = max_bytes
+        self.interval_s = interval_s
+        self.compression = compression
+        self.backup_count = backup_count
+        self._rollover_at = time.time() + interval_s
+        self._last_segment_us = 0
+        # Segments waiting to be compressed, never pruned until compressed
+        self._pending_segments = set()
+        self._compressor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='LogCompressor'
+        )
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        if self.max_bytes > 0 and self.stream.tell() >= self.max_bytes:
+            return True
+        if self.interval_s > 0 and time.time() >= self._rollover_at:
+            return True
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        segment = self._segment_name()
+        if os.path.exists(self.baseFilename):
+            # Marked pending before it appears so a concurrent prune skips it
+            with self.lock:
+                self._pending_segments.add(segment)
+            os.rename(self.baseFilename, segment)
+            self._compressor.submit(self._compress_and_prune, segment)
+        self.stream = self._open()
+        self._rollover_at = time.time() + self.interval_s
+
+    def close(self):
+        super().close()
+        self._compressor.shutdown(wait=True)
+
+    def _segment_name(self) -> str:
+        # Microsecond timestamps keep segment names unique and sortable even
+        # when rotating several times a second
+        now_us = max(time.time_ns() // 10**3, self._last_segment_us + 1)
+        self._last_segment_us = now_us
+        timestamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(now_us // 10**6))
+        return f'{self.baseFilename}.{timestamp}_{now_us % 10**6:06d}'
+
+    def _compress_and_prune(self, segment: str):
+        # Runs on the compressor thread
+        try:
+            if self.compression == 'gzip':
+                with open(segment, 'rb') as ifile, gzip.open(segment + '.gz', 'wb') as ofile:
+                    shutil.copyfileobj(ifile, ofile)
+                os.remove(segment)
+            elif self.compression == 'zstd':
+                with open(segment, 'rb') as ifile, open(segment + '.zst', 'wb') as ofile:
+                    zstandard.ZstdCompressor().copy_stream(ifile, ofile)
+                os.remove(segment)
+        except Exception:
+            # Never let compression errors propagate into the application
+            print_exc(file=sys.stderr)
+        with self.lock:
+            self._pending_segments.discard(segment)
+        try:
+            self._prune_segments()
+        except Exception:
+            print_exc(file=sys.stderr)
+
+    def _prune_segments(self):
+        if self.backup_count <= 0:
+            return
+        dir_path, base = os.path.split(self.baseFilename)
+        segment_re = re.compile(re.escape(base) + r'\.(\d{8}_\d{6}_\d{6})(?:\.gz|\.zst)?$')
+        segments = sorted(
+            (m.group(1), f) for f in os.listdir(dir_path) if (m := segment_re.match(f))
+        )
+        # Read after listing so every pending segment listed is included
+        with self.lock:
+            pending = set(self._pending_segments)
+        for timestamp, segment in segments[:-self.backup_count]:
+            # Segments still queued for compression are left for a later prune
+            if f'{self.baseFilename}.{timestamp}' not in pending:
+                os.remove(os.path.join(dir_path, segment))
+
+def enable_async_logging(
+    logger: logging.Logger,
+    queue_size: int = ASYNC_QUEUE_SIZE_DEFAULT,
+    on_full: str = ASYNC_ON_FULL_DEFAULT,
+) -> QueueListener:
+    '''Move all logger handlers onto a background thread
+
+    The logger's current handlers are removed and attached to a QueueListener
+    thread. The logger gets a single QueueHandler feeding a bounded queue.
+    When the queue is full, records are either dropped (on_full='drop') or the
+    logging call blocks until there is room (on_full='block'). The listener is
+    stopped at exit so queued records are flushed to the real handlers.
+
+    NOTES/WARNINGS
+    - Handlers added to the logger afterwards (e.g. add_log_file) are
+      synchronous again. Configure all handlers before calling this.
+    - The queue handler level is set from the handler and logger levels at
+      the time of the call. Records below it (e.g. from a child logger later
+      set to DEBUG) are not enqueued.
+    '''
+    if on_full not in ('drop', 'block'):
+        raise ValueError(f'Unknown on_full policy: {on_full!r}')
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = FlushingQueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_handler = BoundedQueueHandler(log_queue, block=(on_full == 'block'))
+    # Don't enqueue anything the listener handlers will just discard. NOTSET
+    # handlers are taken to accept whatever the logger lets through
+    effective_level = logger.getEffectiveLevel()
+    queue_handler.setLevel(min(
+        (h.level or effective_level for h in handlers), default=effective_level
+    ))
+    queue_handler.listener = listener
+    logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+class BoundedQueueHandler(QueueHandler):
+    '''QueueHandler with a drop or block policy for a bounded queue
+
+    The queue is in-process so records are enqueued as is and formatted by the
+    listener handlers. The stock prepare() formats and copies every record on
+    the logging thread so records can be pickled for a multiprocessing queue.
+
+    NOTES/WARNINGS
+    - Message args are rendered on the listener thread so don't mutate objects
+      passed as args after logging them
+    '''
+    def __init__(self, queue, block: bool = False):
+        super().__init__(queue)
+        self.block = block
+        self.n_dropped = 0
+        self.listener = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.n_dropped += 1
+
+class FlushingQueueListener(QueueListener):
+    '''QueueListener that drains the queue and flushes handlers on stop
+
+    Handler filters with pending suppression summaries (see RateLimitFilter)
+    are closed once the queue is drained and the summaries they log are
+    handled on the stopping thread.
+    '''
+    def enqueue_sentinel(self):
+        # Base class uses put_nowait which raises if the bounded queue is full
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()
+        for handler in self.handlers:
+            for handler_filter in handler.filters:
+                if isinstance(handler_filter, RateLimitFilter):
+                    handler_filter.close()
+        # Records enqueued after the sentinel (e.g. the summaries above)
+        while True:
+            try:
+                self.handle(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for handler in self.handlers:
+            handler.flush()
+
 class RecordAttributeAdder(logging.Filter):
     '''Pseudo-Filter that adds useful attributes to log records for formatting'''
     def filter(self, record : logging.LogRecord):
         # Strip off parent logger names
-        record.name_last = record.name.rsplit('.', 1)[-1]
+        record.name_last = _name_last(record.name)
+        return True
+
+class RateLimitFilter(logging.Filter):
+    '''Token bucket rate limiting per (logger name, message template)
+
+    Each key gets a bucket of `burst` tokens refilled at `rate_per_s`. Records
+    are dropped while their bucket is empty and the number dropped is appended
+    to the next record that gets through, e.g.
+        'Retrying connection (suppressed 1520 similar messages)'
+    so a hot loop logging the same message collapses into periodic summaries.
+    Keys are the unformatted msg so records differing only in their args count
+    as duplicates. At most max_keys buckets are kept, evicting the least
+    recently used. Counts still pending when a bucket is evicted or close() is
+    called are logged as a summary record with the message template and the
+    highest level suppressed (suppressed records themselves are not kept).
+
+    Add it to handlers (handler.addFilter) rather than a logger: logger
+    filters only see records logged directly on that logger, not ones
+    propagated from child loggers. One instance can be shared by several
+    handlers (see basic_config(rate_limit=True)) as the decision is stored on
+    the record and reused. Note the surviving record's message is modified in
+    place.
+    '''
+    def __init__(
+        self,
+        rate_per_s: float = RATE_LIMIT_PER_S_DEFAULT,
+        burst: int = RATE_LIMIT_BURST_DEFAULT,
+        max_keys: int = RATE_LIMIT_MAX_KEYS_DEFAULT,
+    ):
+        super().__init__()
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, last refill time, n suppressed, max suppressed level]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        # Record attribute caching this filter's decision for other handlers
+        self._passed_attr = f'_rate_limit_passed_{id(self)}'
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        passed = record.__dict__.get(self._passed_attr)
+        if passed is None:
+            passed = self._filter(record)
+            setattr(record, self._passed_attr, passed)
+        return passed
+
+    def _filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg)
+        try:
+            hash(key)
+        except TypeError:
+            # Non-string msg (e.g. logging a dict)
+            key = (record.name, str(record.msg))
+        now = time.monotonic()
+        evicted = None
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0, logging.NOTSET]
+                if len(self._buckets) > self.max_keys:
+                    evicted = self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_s)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                bucket[3] = max(bucket[3], record.levelno)
+                return False
+            bucket[0] -= 1
+            n_suppressed, bucket[2], bucket[3] = bucket[2], 0, logging.NOTSET
+
+        if evicted is not None and evicted[1][2]:
+            evicted_key, evicted_bucket = evicted
+            self._log_summary(evicted_key, evicted_bucket[3], evicted_bucket[2])
+        if n_suppressed:
+            record.msg = f'{record.getMessage()} (suppressed {n_suppressed} similar messages)'
+            record.args = None
         return True
 
+    def close(self):
+        '''Log summaries for all records suppressed since their last summary'''
+        with self._lock:
+            pending = [(key, b[3], b[2]) for key, b in self._buckets.items() if b[2]]
+            for bucket in self._buckets.values():
+                bucket[2], bucket[3] = 0, logging.NOTSET
+        for key, levelno, n_suppressed in pending:
+            self._log_summary(key, levelno, n_suppressed)
+
+    def _log_summary(self, key: tuple, levelno: int, n_suppressed: int):
+        name, msg = key
+        summary = logging.makeLogRecord({
+            'name' : name,
+            'levelno' : levelno,
+            'levelname' : logging.getLevelName(levelno),
+            'msg' : f'{msg} (suppressed {n_suppressed} similar messages)',
+            self._passed_attr : True,
+        })
+        logging.getLogger(name).handle(summary)
+
+class DuplicateFilter(RateLimitFilter):
+    '''Let through one record per (logger name, message template) every interval_s'''
+    def __init__(self, interval_s: float = 1, max_keys: int = RATE_LIMIT_MAX_KEYS_DEFAULT):
+        super().__init__(rate_per_s=1/interval_s, burst=1, max_keys=max_keys)
+
+@functools.lru_cache(maxsize=NAME_LAST_CACHE_SIZE)
+def _name_last(name: str) -> str:
+    return name.rsplit('.', 1)[-1]
+
+def _attr_tuple_getter(names) -> Callable[[object], tuple]:
+    '''attrgetter that always returns a tuple (even for 0 or 1 names)'''
+    if len(names) > 1:
+        return attrgetter(*names)
+    elif names:
+        get_value = attrgetter(names[0])
+        return lambda obj: (get_value(obj),)
+    return lambda obj: ()
+
+class CompiledFormatter(logging.Formatter):
+    '''%-style Formatter with the format string precompiled
+
+    The default PercentStyle formats with `fmt % record.__dict__`, building the
+    lookup for every record. Here the format string is parsed once into a
+    positional format (e.g. '%8s | %s') plus an attrgetter for the referenced
+    record attributes so each record is rendered with a single % operation.
+    Only %-style format strings are supported.
+    '''
+    _field_re = re.compile(r'%\((\w+)\)([#0+ -]*\d*(?:\.\d+)?[diouxXeEfFgGcrsa])')
+
+    def __init__(self, fmt: str = None, datefmt: str = None, validate: bool = True):
+        super().__init__(fmt, datefmt, style='%', validate=validate)
+        fmt = self._style._fmt
+        fields = self._field_re.findall(fmt)
+        self._positional_fmt = self._field_re.sub(lambda m: '%' + m.group(2), fmt)
+        self._get_values = _attr_tuple_getter([name for name, _ in fields])
+        self._uses_time = self._style.usesTime()
+
+    def usesTime(self) -> bool:
+        return self._uses_time
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        return self._positional_fmt % self._get_values(record)
+
+class JsonLinesFormatter(logging.Formatter):
+    '''Format records as single line JSON objects
+
+    The JSON object template (e.g. '{"created":%s,"levelname":%s}') is built
+    once from the field names so each record is encoded with a single %
+    operation on the encoded values, without building a dict to pass through
+    json.dumps. Strings (the common case) go straight to the C string encoder.
+    Exception and stack info are added under "exc_text" and "stack_info".
+    '''
+    def __init__(self, fields: tuple[str, ...] = JSON_FIELDS_DEFAULT, datefmt: str = None):
+        super().__init__(datefmt=datefmt)
+        if not fields:
+            raise ValueError('JsonLinesFormatter requires at least one field')
+        self.fields = tuple(fields)
+        self._template = '{' + ','.join(f'{encode_basestring(f)}:%s' for f in self.fields)
+        self._get_values = _attr_tuple_getter(self.fields)
+        self._uses_time = 'asctime' in self.fields
+
+    def usesTime(self) -> bool:
+        return self._uses_time
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.message = record.getMessage()
+        if self._uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        s = self._template % tuple(map(_json_value, self._get_values(record)))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            s += ',"exc_text":' + encode_basestring(record.exc_text)
+        if record.stack_info:
+            s += ',"stack_info":' + encode_basestring(self.formatStack(record.stack_info))
+        return s + '}'
+
+def _json_value(value) -> str:
+    if type(value) is str:
+        return encode_basestring(value)
+    return json.dumps(value, default=str)
+
+def read_json_lines(path: Path) -> Iterator[dict]:
+    '''Stream records back out of a JSON lines log file
+
+    Rotated segments compressed with gzip or zstd (.gz or .zst) are
+    decompressed on the fly.
+    '''
+    path = Path(path)
+    if path.suffix == '.gz':
+        ifile = gzip.open(path, 'rt')
+    elif path.suffix == '.zst':
+        if zstandard is None:
+            raise ImportError('Reading .zst files requires the zstandard package')
+        ifile = zstandard.open(path, 'rt')
+    else:
+        ifile = path.open('r')
+    with ifile:
+        for line in ifile:
+            if line.strip():
+                yield json.loads(line)
+
 def redirect_exceptions_to_logger(logger: logging.Logger):
     # Overwrite hook for processing exceptions
     # https://stackoverflow.com/questions/6234405/logging-uncaught-exceptions-in-python
@@ -196,47 +812,176 @@ def capture_python_stdout(log):
     sys.stderr = LoggerWriter(stderr_log.warning) # log.error?
 
 class LoggerWriter(object):
-    def __init__(self, writer):
+    '''File-like object that sends lines written to it to a logger
+
+    Writes are buffered until one ends with a newline, so everything written
+    for a line (e.g. print(..., end='') calls) or a multiline print() (which
+    writes the trailing newline separately) is sent as a single record. Blank
+    lines are dropped. Anything still buffered is sent on flush() and at exit,
+    or once it reaches max_line_len characters (e.g. progress bars that only
+    write '\r').
+    '''
+    def __init__(self, writer, max_line_len: int = MAX_LINE_LEN_DEFAULT):
         #self.encoding = sys.stdout.encoding # Getting issues with doctest
         self._writer = writer
-        self._msg = ''
-
-    def write(self, message):
-        for line in message.rstrip().splitlines():
-            self._writer(line.rstrip())
-        ## Prevent carriage return and empty newlines
-        #msg = message.lstrip('\r').lstrip('\n')
+        self.max_line_len = max_line_len
+        self._parts = []
+        self._n_buffered = 0
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
 
-        #self._msg = self._msg + msg
-        #while '\n' in self._msg:
-        #    pos = self._msg.find('\n')
-        #    self._writer(self._msg[:pos]+'\n')
-        #    self._msg = self._msg[pos+1:]
+    def write(self, message: str) -> int:
+        with self._lock:
+            self._parts.append(message)
+            self._n_buffered += len(message)
+            if not message.endswith('\n') and self._n_buffered < self.max_line_len:
+                return len(message)
+            text = self._take_buffered()
+        self._write_lines(text)
+        return len(message)
 
     def flush(self):
-        pass
-        # if self._msg != '':
-        #     self._writer(self._msg)
-        #     self._msg = ''
-
-def capture_unix_fd():
-    # TODO: Currently doesn't work
-    # Also risk of infinite pipe loop as python stdout gets redirected back
-    # to logger that prints it to stdout
-    # Source: https://stackoverflow.com/questions/616645/how-to-duplicate-sys-stdout-to-a-log-file
-    import subprocess, os, sys
-
-    tee = subprocess.Popen(["tee", "log.txt"], stdin=subprocess.PIPE)
-    # Cause tee's stdin to get a copy of our stdin/stdout (as well as that
-    # of any child processes we spawn)
-    os.dup2(tee.stdin.fileno(), sys.stdout.fileno())
-    os.dup2(tee.stdin.fileno(), sys.stderr.fileno())
-
-    # The flush flag is needed to guarantee these lines are written before
-    # the two spawned /bin/ls processes emit any output
-    print("\nstdout", flush=True)
-    print("stderr", file=sys.stderr, flush=True)
-
-    # These child processes' stdin/stdout are
-    os.spawnve("P_WAIT", "/bin/ls", ["/bin/ls"], {})
-    os.execve("/bin/ls", ["/bin/ls"], os.environ)
+        with self._lock:
+            text = self._take_buffered()
+        self._write_lines(text)
+
+    def _take_buffered(self) -> str:
+        text = ''.join(self._parts)
+        self._parts = []
+        self._n_buffered = 0
+        return text
+
+    def _write_lines(self, text: str):
+        # Prevent carriage returns, trailing whitespace, and empty newlines
+        lines = [line.rstrip() for line in text.lstrip('\r').splitlines()]
+        msg = '\n'.join(line for line in lines if line)
+        if msg:
+            self._writer(msg)
+
+def capture_unix_fd(log) -> 'FdCapture':
+    '''Capture unix stdout/stderr (fd 1 & 2) and send to logger
+
+    Unlike capture_python_stdout, this also captures output written directly
+    to the file descriptors (e.g. C extensions, child processes, os.system).
+    See FdCapture for details.
+    '''
+    fd_capture = FdCapture({
+        1 : logging.getLogger(f'{log.name}.stdout_fd').info,
+        2 : logging.getLogger(f'{log.name}.stderr_fd').warning,
+    })
+    fd_capture.start()
+    atexit.register(fd_capture.stop)
+    return fd_capture
+
+class FdCapture:
+    '''Redirect file descriptors into a pipe drained by a logger thread
+
+    Each fd is dup2'd onto the write end of a pipe and a reader thread turns
+    the pipe output into log records, one per line. Child processes inherit
+    the redirected fds so their output is captured without an extra tee
+    process. Buffering is bounded by the pipe itself (writers block when the
+    reader falls behind) and by max_line_bytes for a single partial line.
+
+    To avoid a feedback loop (log record -> StreamHandler -> fd -> pipe ->
+    log record), StreamHandlers writing to a captured fd are pointed at a
+    duplicate of the original fd while capturing. This includes handlers
+    behind a QueueListener (see enable_async_logging) and handlers added after
+    start(), which the reader threads pick up before logging each chunk. A
+    reader thread also never logs lines while it is already logging (e.g. a
+    writer that ends up writing to a captured stream in the same thread).
+    '''
+    def __init__(self, writers: dict, max_line_bytes: int = MAX_LINE_LEN_DEFAULT):
+        self.writers = writers
+        self.max_line_bytes = max_line_bytes
+        self._saved_fds = {}
+        self._saved_streams = {}
+        self._threads = []
+        self._handler_streams = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd in self.writers:
+            self._saved_fds[fd] = os.dup(fd)
+        self._retarget_handlers()
+        for fd, writer in self.writers.items():
+            read_fd, write_fd = os.pipe()
+            os.dup2(write_fd, fd)
+            os.close(write_fd)
+            thread = threading.Thread(
+                target=self._drain, args=(read_fd, writer), name=f'FdCapture-{fd}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 1):
+        if not self._saved_fds:
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Restoring the fds closes the last write end of each pipe (unless a
+        # child process still holds it) so the reader threads see EOF
+        for fd, saved_fd in self._saved_fds.items():
+            os.dup2(saved_fd, fd)
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            for handler, stream in self._handler_streams.items():
+                handler.setStream(stream)
+            for saved_fd in self._saved_fds.values():
+                os.close(saved_fd)
+            self._saved_fds = {}
+            self._saved_streams = {}
+            self._threads = []
+            self._handler_streams = {}
+
+    def _retarget_handlers(self):
+        loggers = [logging.root, *logging.root.manager.loggerDict.values()]
+        handlers = {h for log in loggers for h in getattr(log, 'handlers', [])}
+        # Handlers run by a QueueListener thread (e.g. BoundedQueueHandler)
+        handlers |= {
+            h for handler in list(handlers)
+            for h in getattr(getattr(handler, 'listener', None), 'handlers', [])
+        }
+        with self._lock:
+            for handler in handlers:
+                if handler in self._handler_streams or not isinstance(handler, logging.StreamHandler):
+                    continue
+                try:
+                    fd = handler.stream.fileno()
+                except (AttributeError, ValueError, OSError):
+                    continue
+                if fd not in self._saved_fds:
+                    continue
+                if fd not in self._saved_streams:
+                    self._saved_streams[fd] = open(
+                        self._saved_fds[fd], 'w', buffering=1, closefd=False
+                    )
+                self._handler_streams[handler] = handler.setStream(self._saved_streams[fd])
+
+    def _drain(self, read_fd: int, writer):
+        partial = b''
+        with open(read_fd, 'rb', buffering=0) as pipe:
+            while chunk := pipe.read(self.max_line_bytes):
+                *lines, partial = (partial + chunk).split(b'\n')
+                if len(partial) >= self.max_line_bytes:
+                    lines.append(partial)
+                    partial = b''
+                # Catch handlers added since start() before logging through them
+                self._retarget_handlers()
+                self._write_lines(lines, writer)
+        self._write_lines([partial], writer)
+
+    def _write_lines(self, lines: list[bytes], writer):
+        if getattr(self._local, 'writing', False):
+            return
+        self._local.writing = True
+        try:
+            for line in lines:
+                line = line.decode(errors='replace').rstrip()
+                if line:
+                    writer(line)
+        finally:
+            self._local.writing = False
@@ -43,6 +43,7 @@ def get_args():
     parser.add_argument('-o', '--log-path', type=Path)
     parser.add_argument('-l', '--log-level', default='WARNING') # log_level
     parser.add_argument('-c', '--log-conf', type=Path)
+    parser.add_argument('--capture-fd', action='store_true', help='Capture unix stdout/stderr')
     args = parser.parse_args()
     return args
 
@@ -54,6 +55,8 @@ def main():
         logging.config.dictConfig(dict_config)
     else:
         logger.basic_config(level=args.log_level, log_path=args.log_path)
+    if args.capture_fd:
+        logger.capture_unix_fd(log)
 
     logger.log_multiline(log.debug, logger.log_hierarchy_summary_str())
 
@@ -66,7 +69,7 @@ def main():
     print('sys.stdout message')
     print('sys.stderr message', file=sys.stderr)
 
-    # Currently not sure if system messages (i.e. fd 1 & 2) can be captured
+    # System messages (i.e. fd 1 & 2) are only captured with --capture-fd
     subprocess.run('echo Unix stdout message'.split())
     #subprocess.run('echo "Unix stderr message" >&2'.split()) # Doesn't work
     os.system('echo "Unix stderr message" >&2')
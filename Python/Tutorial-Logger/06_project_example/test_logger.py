@@ -0,0 +1,59 @@
+import io
+import logging
+
+import logger
+
+################################################################################
+# log_hierarchy_summary_str
+def test_hierarchy_summary_tracks_handler_stream(tmp_path):
+    log = logging.getLogger(f'{logger.PROJECT_LOGGER_NAME}.test_summary')
+    handler = logging.StreamHandler(io.StringIO())
+    log.addHandler(handler)
+    try:
+        before = logger.log_hierarchy_summary_str()
+        with open(tmp_path / 'new_stream.log', 'w') as stream:
+            handler.setStream(stream)
+            after = logger.log_hierarchy_summary_str()
+        assert 'new_stream.log' not in before
+        assert 'new_stream.log' in after
+    finally:
+        log.removeHandler(handler)
+
+################################################################################
+# LoggerWriter
+def test_logger_writer_caps_partial_line():
+    messages = []
+    writer = logger.LoggerWriter(messages.append, max_line_len=10)
+    for i in range(12):
+        writer.write(f'\r{i:3d}%')
+    # Without the cap nothing would be logged until a newline
+    assert len(messages) == 6
+    assert messages[-1].split() == ['10%', '11%']
+    writer.write('done\n')
+    assert messages[-1] == 'done'
+
+################################################################################
+# RateLimitFilter
+def test_rate_limit_summary_does_not_keep_suppressed_records():
+    log = logging.getLogger(f'{logger.PROJECT_LOGGER_NAME}.test_rate_limit')
+    rate_limit_filter = logger.RateLimitFilter(rate_per_s=0, burst=1)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    handler.addFilter(rate_limit_filter)
+    log.addHandler(handler)
+    try:
+        for i in range(3):
+            try:
+                raise ValueError(i)
+            except ValueError:
+                log.exception('Failed on %d', i)
+        assert len(records) == 1
+        rate_limit_filter.close()
+    finally:
+        log.removeHandler(handler)
+
+    summary = records[-1]
+    assert summary.getMessage() == 'Failed on %d (suppressed 2 similar messages)'
+    assert summary.levelno == logging.ERROR
+    assert summary.exc_info is None
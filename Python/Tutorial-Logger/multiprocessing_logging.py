@@ -3,18 +3,28 @@
 Example script for logging in a multiprocessing pool context
 """
 # Standard library
+import atexit
+from collections import deque
 import concurrent.futures as cf
 import functools
+import itertools
+import json
 import logging
 from logging.handlers import QueueHandler, QueueListener
 import logging.config
 import multiprocessing as mp
+from multiprocessing.pool import Pool
 from multiprocessing.process import BaseProcess
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+import os
+import queue
 import random
 import re
+import struct
 import threading
 import time
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional
 
 # Globals
 log = logging.getLogger(__name__)
@@ -22,6 +32,21 @@ log = logging.getLogger(__name__)
 cfg = {
     "n_tasks": 3,
     "n_processes": 2,
+    # Rounds of tasks run on the same (warm) worker pool in main_pool
+    "n_rounds": 2,
+    # Queue for shipping log records from workers: "manager" or "shm"
+    "log_transport": "manager",
+    # Target duration of each chunk of tasks sent to a worker (see
+    # adaptive_imap_unordered)
+    "target_chunk_s": 0.1,
+    # Max tasks submitted but not yet returned (see bounded_imap_unordered).
+    # None for two per worker
+    "max_in_flight": None,
+    # Send log records in batches (see BatchingQueueHandler). None to disable
+    "log_batching": {
+        "batch_size"    : 100,
+        "max_latency_s" : 0.1,
+    },
     "logging": {
         "dictConfig" : {
             "version" : 1,
@@ -67,82 +92,127 @@ cfg = {
 ################################################################################
 def main_pool():
     my_args1 = range(cfg["n_tasks"])
-    my_args2 = reversed(range(cfg["n_tasks"]))
-    basic_config = cfg["logging"]
+    my_args2 = list(reversed(range(cfg["n_tasks"])))
+    logging_cfg = cfg["logging"]
     set_process_name(mp.current_process())
 
     with mp.Manager() as manager:
         # NOTE: The Manager starts its own child process so child processes in
         # the pool will start with a number ID of 2
-        queue = manager.Queue(-1)
-
-        # Configure main process logging
-        # Option 1: Logging handled in main process by thread
-        log_listener = threading.Thread(
-            target=start_log_listener, args=(queue, basic_config)
-        )
-        log_listener.start()
-        # Option 2: Logging handled by child process
-        # log.addHandler(QueueHandler(queue)) import
-        # QueueListener
-
-        # Combine/Simplify inputs for multiprocessing
-        mp_configure_logging_partial = functools.partial(
-            mp_configure_logging,
-            queue=queue,
-            log_level=basic_config["level"],
-        )
-
-        def noisy_mp_iterable():
-            # For demoing which functions support lazy evaluation
-            for x, y in zip(my_args1, my_args2):
-                log.info("Generating args = %s", (x, y))
-                time.sleep(random.random())
-                yield x, y
-
-        mp_iterable = noisy_mp_iterable()
-        # mp_iterable = zip(my_args1, my_args2)
-
-        log.info("Starting worker pool")
-        # Option A: multiprocessing Pool
-        with mp.Pool(
-            processes=cfg["n_processes"],
-            initializer=_mp_initalizer,
-            initargs=(mp_configure_logging_partial,),
-        ) as pool:
+        if cfg["log_transport"] == "shm":
+            # One shared memory ring buffer per process (see ShmLogQueue)
+            queue = ShmLogQueue(n_writers=cfg["n_processes"] + 1)
+        else:
+            queue = manager.Queue(-1)
+
+        try:
+            # Configure main process logging
+            logging.config.dictConfig(logging_cfg["dictConfig"])
+            handler_names = {'console', 'file'} & logging.getHandlerNames()
+            handlers = [logging.getHandlerByName(x) for x in handler_names]
+            log_level = min(h.level for h in handlers)
+            level_pushdown = LogLevelPushdown(
+                compute_log_levels(logging_cfg["dictConfig"], handlers)
+            )
+            configure_queue_logging(queue, log_level, cfg["log_batching"], level_pushdown)
+            # Option 1: Logging handled in main process by thread
+            log_listener = threading.Thread(
+                target=start_log_listener, args=(queue, handlers)
+            )
+            log_listener.start()
+            # Option 2: Logging handled by child process
+            # log.addHandler(QueueHandler(queue)) import
+            # QueueListener
+
+            # Combine/Simplify inputs for multiprocessing
+            mp_configure_logging_partial = functools.partial(
+                configure_queue_logging,
+                queue=queue,
+                log_level=log_level,
+                batching=cfg["log_batching"],
+                level_pushdown=level_pushdown,
+            )
+
+            def noisy_mp_iterable():
+                # For demoing which functions support lazy evaluation
+                for x, y in zip(my_args1, my_args2):
+                    log.info("Generating args = %s", (x, y))
+                    time.sleep(random.random())
+                    yield x, y
+
+            log.info("Starting worker pool")
+            # Option A: multiprocessing Pool started on first use and kept warm
+            # across rounds so workers are only spawned (and have logging
+            # configured) once
+            pool = WarmPool(
+                processes=cfg["n_processes"],
+                initializer=_mp_initalizer,
+                initargs=(mp_configure_logging_partial,),
+            )
+            # Option A2: New multiprocessing Pool for each round
+            # with mp.Pool(
+            #     processes=cfg["n_processes"],
+            #     initializer=_mp_initalizer,
+            #     initargs=(mp_configure_logging_partial,),
+            # ) as pool:
             # Option 2: Logging handled by child process
             # pool.apply_async(start_log_listener, args=(queue, basic_config))
 
-            log.info("Starting %d worker processes", pool._processes)
-            # Option I: Get results as they complete
-            results = pool.imap_unordered(_mp_pow, mp_iterable)
-            # Option II: Get results in order after generating all input arguments
-            # results = pool.map(_mp_pow, mp_iterable)
-            # Option III: Get results in order with lazy generator evaluation
-            # results = pool.imap(_mp_pow, mp_iterable)
-
-            for args, result in results:
-                log.info("Got result: pow%s = %s", args, result)
-
-        # Option B: concurrent.futures ProcessPoolExecutor
-        # with cf.ProcessPoolExecutor(
-        #     max_workers = cfg["n_processes"],
-        #     initializer = _mp_initalizer,
-        #     initargs    = (mp_configure_logging_partial,)
-        # ) as executor:
-        #     # Option I: Get results as the complete
-        #     futures = [executor.submit(_mp_pow, arg) for arg in mp_iterable]
-        #     results = (future.result() for future in cf.as_completed(futures))
-        #     # Option II: Get results in order
-        #     # results = executor.map(_mp_pow, mp_iterable)
-
-        #     # Do something with results
-        #     for arg, result in results:
-        #         log.info("Got result: pow%s = %s", arg, result)
-
-        queue.put_nowait(None)
-        log_listener.join()
-        log.info("Main process done")
+            for n_round in range(cfg["n_rounds"]):
+                mp_iterable = noisy_mp_iterable()
+                # mp_iterable = zip(my_args1, my_args2)
+
+                log.info("Starting round %d with %d worker processes", n_round, pool._processes)
+                # Option I: Get results as they complete
+                # results = pool.imap_unordered(_mp_pow, mp_iterable)
+                # Option Ib: Same but tasks sent in chunks sized from their runtime
+                results = adaptive_imap_unordered(
+                    pool, _mp_pow, mp_iterable, target_chunk_s=cfg["target_chunk_s"]
+                )
+                # Option Ic: Same but input only read as results complete so the
+                # number of pending inputs is bounded
+                # results = bounded_imap_unordered(
+                #     pool, _mp_pow, mp_iterable, max_in_flight=cfg["max_in_flight"]
+                # )
+                # Option II: Get results in order after generating all input arguments
+                # results = pool.map(_mp_pow, mp_iterable)
+                # Option III: Get results in order with lazy generator evaluation
+                # results = pool.imap(_mp_pow, mp_iterable)
+
+                for args, result in results:
+                    log.info("Got result: pow%s = %s", args, result)
+
+            # Let workers exit normally (instead of terminate()) so they flush any
+            # batched log records
+            pool.shutdown()
+
+            # Option B: concurrent.futures ProcessPoolExecutor
+            # with cf.ProcessPoolExecutor(
+            #     max_workers = cfg["n_processes"],
+            #     initializer = _mp_initalizer,
+            #     initargs    = (mp_configure_logging_partial,)
+            # ) as executor:
+            #     # Option I: Get results as the complete, submitting tasks as
+            #     # earlier ones finish instead of all futures up front
+            #     results = bounded_imap_unordered(
+            #         executor, _mp_pow, mp_iterable, max_in_flight=cfg["max_in_flight"]
+            #     )
+            #     # Option II: Get results in order
+            #     # results = executor.map(_mp_pow, mp_iterable)
+
+            #     # Do something with results
+            #     for arg, result in results:
+            #         log.info("Got result: pow%s = %s", arg, result)
+
+            log.info("Main process done")
+            flush_handlers(logging.root)
+            queue.put_nowait(None)
+            log_listener.join()
+            logging.root.handlers.clear()
+        finally:
+            # Unlink the shared memory even if a task or the listener fails
+            if isinstance(queue, ShmLogQueue):
+                queue.close()
 
 
 def main_manual():
@@ -153,10 +223,15 @@ def main_manual():
     handler_names = {'console', 'file'} & logging.getHandlerNames() 
     handlers = [logging.getHandlerByName(x) for x in handler_names]
     log_level = min(h.level for h in handlers)
-    configure_queue_logging(queue, log_level)
+    # Per-logger levels so workers never create records the listener drops.
+    # Call level_pushdown.set_levels() to change worker levels at runtime.
+    level_pushdown = LogLevelPushdown(
+        compute_log_levels(cfg["logging"]["dictConfig"], handlers)
+    )
+    configure_queue_logging(queue, log_level, cfg["log_batching"], level_pushdown)
     log.critical('CRITICAL TEST')
 
-    log_listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    log_listener = BatchQueueListener(queue, *handlers, respect_handler_level=True)
     log_listener.start()
     log.info(f"Log listener configured")
 
@@ -164,6 +239,8 @@ def main_manual():
         configure_queue_logging,
         queue=queue,
         log_level=log_level,
+        batching=cfg["log_batching"],
+        level_pushdown=level_pushdown,
     )
 
     # Create Process instances
@@ -189,6 +266,7 @@ def main_manual():
     # Shutdown
     log.debug("Shutting down")
     log.info("Done")
+    flush_handlers(logging.root)
     log_listener.stop()
 
 # Use-case specific wrappers to standardize calls to multiprocessing API
@@ -222,6 +300,175 @@ def _mp_target_pow(configure_logging, *args, **kwargs):
     return pow(*args, **kwargs)
 
 
+################################################################################
+# Warm worker pool
+class WarmPool:
+    """Process pool started on first use and reused until shutdown
+
+    Creating a Pool spawns every worker and runs the initializer (e.g.
+    _mp_initalizer logging setup) in each, which costs more than many small
+    rounds of tasks. A WarmPool keeps the same workers across calls. Pool
+    methods (map, imap_unordered, apply_async, ...) are forwarded to the
+    underlying Pool, which is created on first use. resize() replaces the
+    workers after outstanding tasks finish and the pool is shut down at exit.
+    """
+    def __init__(self, processes: Optional[int] = None, initializer=None, initargs=()):
+        # Same name as the Pool attribute so code reading pool._processes works
+        self._processes = processes or os.cpu_count()
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def __getattr__(self, name):
+        # Only forward public Pool attributes (also avoids recursion on
+        # attributes missing during unpickling/copying)
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.pool, name)
+
+    @property
+    def pool(self) -> Pool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = mp.Pool(
+                    processes=self._processes,
+                    initializer=self._initializer,
+                    initargs=self._initargs,
+                )
+            return self._pool
+
+    def resize(self, processes: int):
+        """Change number of workers. Waits for outstanding tasks to finish"""
+        with self._lock:
+            if processes == self._processes:
+                return
+            old_pool, self._pool = self._pool, None
+            self._processes = processes
+        if old_pool is not None:
+            old_pool.close()
+            old_pool.join()
+
+    def shutdown(self, wait: bool = True):
+        """Stop workers. If wait, let them finish outstanding tasks first"""
+        with self._lock:
+            old_pool, self._pool = self._pool, None
+        if old_pool is None:
+            return
+        if wait:
+            old_pool.close()
+        else:
+            old_pool.terminate()
+        old_pool.join()
+
+################################################################################
+# Adaptive task dispatch
+MAX_CHUNKSIZE = 10_000
+
+def adaptive_imap_unordered(
+    pool: Pool,
+    func: Callable,
+    iterable: Iterable,
+    target_chunk_s: float = 0.1,
+    max_chunksize: int = MAX_CHUNKSIZE,
+) -> Iterator:
+    """pool.imap_unordered with the chunksize adapted to the task duration
+
+    With chunksize=1 (the imap_unordered default) every task costs an IPC round
+    trip, which dominates for cheap tasks, while a large fixed chunksize
+    hurts load balancing for expensive ones. Here each chunk is timed in the
+    worker and the next chunksize is set so a chunk takes about target_chunk_s,
+    starting from 1. Results are yielded as chunks complete, and at most two
+    chunks per worker are in flight so the input is consumed lazily.
+    """
+    it = iter(iterable)
+    chunksize = 1
+    task_s = None
+
+    def chunks():
+        # Sized when read, i.e. as earlier chunks complete
+        while chunk := list(itertools.islice(it, chunksize)):
+            yield chunk
+
+    chunk_results = _bounded_dispatch(
+        pool, functools.partial(_run_chunk, func), chunks(), 2 * pool._processes
+    )
+    for results, duration in chunk_results:
+        # Exponential moving average of per task duration
+        chunk_task_s = duration / len(results)
+        task_s = chunk_task_s if task_s is None else 0.5 * (task_s + chunk_task_s)
+        chunksize = max(1, min(max_chunksize, round(target_chunk_s / max(task_s, 1e-9))))
+        yield from results
+
+def _run_chunk(func: Callable, chunk: list) -> tuple[list, float]:
+    start = time.perf_counter()
+    results = [func(args) for args in chunk]
+    return results, time.perf_counter() - start
+
+################################################################################
+# Bounded in-flight task dispatch
+def bounded_imap_unordered(
+    executor,
+    func: Callable,
+    iterable: Iterable,
+    max_in_flight: Optional[int] = None,
+) -> Iterator:
+    """imap_unordered that only reads the input as results complete
+
+    Pool.imap_unordered reads the input iterator in a background thread as
+    fast as tasks can be written to the workers and submitting every future to
+    a concurrent.futures Executor up front reads all of it, so memory grows
+    with the input for large generators and slow tasks. Here at
+    most max_in_flight tasks (default: two per worker) are submitted at a time
+    and the next input is only read once a result is yielded. executor is a
+    Pool (or WarmPool) or a concurrent.futures Executor.
+    """
+    if max_in_flight is None:
+        if isinstance(executor, cf.Executor):
+            n_workers = getattr(executor, "_max_workers", None)
+        else:
+            n_workers = getattr(executor, "_processes", None)
+        max_in_flight = 2 * (n_workers or os.cpu_count())
+    if max_in_flight < 1:
+        raise ValueError(f"max_in_flight must be >= 1: {max_in_flight}")
+
+    yield from _bounded_dispatch(executor, func, iterable, max_in_flight)
+
+def _bounded_dispatch(executor, func: Callable, inputs: Iterable, max_in_flight: int) -> Iterator:
+    """Yield func(args) for each input as tasks complete, at most max_in_flight at a time
+
+    The next input is read once a task completes and submitted before its
+    result is yielded so workers stay busy while the caller handles it.
+    executor is a Pool (or WarmPool) or a concurrent.futures Executor.
+    """
+    done = queue.SimpleQueue()
+    if isinstance(executor, cf.Executor):
+        def submit(args):
+            executor.submit(func, args).add_done_callback(done.put)
+    else:
+        def submit(args):
+            executor.apply_async(
+                func, (args,), callback=done.put, error_callback=done.put
+            )
+
+    it = iter(inputs)
+    n_in_flight = 0
+    for args in itertools.islice(it, max_in_flight):
+        submit(args)
+        n_in_flight += 1
+    while n_in_flight:
+        result = done.get()
+        n_in_flight -= 1
+        if isinstance(result, cf.Future):
+            result = result.exception() or result.result()
+        if isinstance(result, BaseException):
+            raise result
+        for args in itertools.islice(it, 1):
+            submit(args)
+            n_in_flight += 1
+        yield result
+
 ################################################################################
 # Generally useful functions
 def set_process_name(process: Optional[BaseProcess] = None):
@@ -232,16 +479,420 @@ def set_process_name(process: Optional[BaseProcess] = None):
         process.name = "P0"
     else:
         process.name = re.sub(
-            r"^(?:SpawnPoolWorker|SpawnProcess|Process)-", "P", process.name
+            r"^(?:SpawnPoolWorker|ForkPoolWorker|SpawnProcess|Process)-", "P", process.name
         )
 
-def configure_queue_logging(queue, log_level):
-    queue_handler = QueueHandler(queue)
+def start_log_listener(queue, handlers):
+    """Pass records from queue to handlers until a None sentinel is received
+
+    Equivalent to a BatchQueueListener with respect_handler_level=True but run
+    manually as the thread target
+    """
+    while (item := queue.get()) is not None:
+        records = item if isinstance(item, list) else [item]
+        for record in records:
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+def configure_queue_logging(
+    queue,
+    log_level,
+    batching: Optional[dict] = None,
+    level_pushdown: Optional["LogLevelPushdown"] = None,
+):
+    if batching is None:
+        queue_handler = QueueHandler(queue)
+    else:
+        queue_handler = BatchingQueueHandler(queue, **batching)
     root = logging.root
+    # Forked processes inherit the parent's queue handler
+    for handler in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(handler)
     root.addHandler(queue_handler)
     root.setLevel(log_level)
+    if level_pushdown is not None:
+        level_pushdown.apply()
+        level_pushdown.watch()
     log.info('Logging configured')
 
+def flush_handlers(logger: logging.Logger):
+    for handler in logger.handlers:
+        handler.flush()
+
+################################################################################
+# Log level pushdown
+LEVEL_PUSHDOWN_MAX_BYTES = 64 * 1024
+LEVEL_PUSHDOWN_POLL_INTERVAL_S = 0.5
+
+def compute_log_levels(dict_config: dict, handlers: list[logging.Handler]) -> dict[str, int]:
+    """Lowest level each logger needs to send records to the listener
+
+    Every record a worker ships is passed to the listener handlers, so nothing
+    below the lowest handler level is worth creating. Loggers configured in
+    dict_config are raised to that level (and keep a higher configured level).
+    The root logger is keyed by "".
+
+    Handlers dict_config attaches to individual loggers are not considered as
+    the listener never passes worker records to them (they only see records
+    logged in the main process).
+    """
+    min_handler_level = min(h.level for h in handlers)
+
+    def threshold(logger_cfg: dict) -> int:
+        return max(_level_number(logger_cfg.get("level", logging.NOTSET)), min_handler_level)
+
+    levels = {"": threshold(dict_config.get("root") or {})}
+    for name, logger_cfg in dict_config.get("loggers", {}).items():
+        if "level" in logger_cfg:
+            levels[name] = threshold(logger_cfg)
+    return levels
+
+def _level_number(level) -> int:
+    if isinstance(level, str):
+        return logging.getLevelNamesMapping()[level.upper()]
+    return level
+
+class LogLevelPushdown:
+    """Per-logger levels set in the main process and applied in workers
+
+    The levels are stored as JSON in shared memory alongside a version counter.
+    Workers apply them when logging is configured (see configure_queue_logging)
+    and a watcher thread re-applies them whenever the version changes, so
+    set_levels() in the main process takes effect in running workers within
+    poll_interval_s.
+    """
+    def __init__(self, levels: dict[str, int], poll_interval_s: float = LEVEL_PUSHDOWN_POLL_INTERVAL_S):
+        self.poll_interval_s = poll_interval_s
+        self._version = mp.Value("L", 0)
+        self._levels_json = mp.Array("c", LEVEL_PUSHDOWN_MAX_BYTES, lock=False)
+        self._owner_pid = os.getpid()
+        self._applied_names = set()
+        self.set_levels(levels)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_applied_names"] = set()
+        return state
+
+    def set_levels(self, levels: dict[str, int]):
+        data = json.dumps(levels).encode()
+        if len(data) >= LEVEL_PUSHDOWN_MAX_BYTES:
+            raise ValueError(f"Log levels take more than {LEVEL_PUSHDOWN_MAX_BYTES} bytes")
+        with self._version.get_lock():
+            self._levels_json.value = data
+            self._version.value += 1
+
+    def get_levels(self) -> tuple[int, dict[str, int]]:
+        with self._version.get_lock():
+            return self._version.value, json.loads(self._levels_json.value)
+
+    def apply(self) -> int:
+        """Set logger levels in this process. Returns the applied version"""
+        version, levels = self.get_levels()
+        # Loggers no longer in the mapping go back to inheriting their level
+        for name in self._applied_names - levels.keys():
+            logging.getLogger(name).setLevel(logging.NOTSET)
+        for name, level in levels.items():
+            logger = logging.root if name == "" else logging.getLogger(name)
+            logger.setLevel(level)
+        self._applied_names = set(levels) - {""}
+        return version
+
+    def watch(self):
+        """Re-apply levels in a background thread when they change (workers only)"""
+        if os.getpid() == self._owner_pid:
+            return
+        threading.Thread(target=self._watch, name="LogLevelPushdown", daemon=True).start()
+
+    def _watch(self):
+        applied_version = self._version.value
+        while True:
+            time.sleep(self.poll_interval_s)
+            if self._version.value != applied_version:
+                applied_version = self.apply()
+
+################################################################################
+# Batched log transport
+BATCH_SIZE_DEFAULT = 100
+BATCH_MAX_LATENCY_S_DEFAULT = 0.1
+
+class BatchingQueueHandler(QueueHandler):
+    """QueueHandler that enqueues lists of records instead of single records
+
+    Amortizes the queue lock and pickling over many records. The batch is sent
+    when it reaches batch_size records, when the oldest record has waited
+    max_latency_s (checked by a background thread), when a record at
+    flush_level or above arrives, or on flush() (e.g. at process exit).
+    The listener must unpack the batches (see BatchQueueListener).
+    """
+    def __init__(
+        self,
+        queue,
+        batch_size: int = BATCH_SIZE_DEFAULT,
+        max_latency_s: float = BATCH_MAX_LATENCY_S_DEFAULT,
+        flush_level: int = logging.ERROR,
+    ):
+        super().__init__(queue)
+        self.batch_size = batch_size
+        self.max_latency_s = max_latency_s
+        self.flush_level = flush_level
+        self._batch = []
+        self._batch_start = 0
+        self._stop_flushing = threading.Event()
+        self._flush_thread = threading.Thread(
+            target=self._flush_periodically, name="BatchingQueueHandler", daemon=True
+        )
+        self._flush_thread.start()
+        # atexit (and so logging.shutdown) is not run in multiprocessing
+        # children but their finalizers are
+        Finalize(None, self.flush, exitpriority=10)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            prepared = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if not self._batch:
+            self._batch_start = time.monotonic()
+        self._batch.append(prepared)
+        if len(self._batch) >= self.batch_size or record.levelno >= self.flush_level:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self._batch:
+                return
+            batch, self._batch = self._batch, []
+            try:
+                self.enqueue(batch)
+            except Exception:
+                self.handleError(batch[-1])
+
+    def close(self):
+        self._stop_flushing.set()
+        self.flush()
+        super().close()
+
+    def _flush_periodically(self):
+        while not self._stop_flushing.wait(self.max_latency_s / 2):
+            if self._batch and time.monotonic() - self._batch_start >= self.max_latency_s:
+                self.flush()
+
+class BatchQueueListener(QueueListener):
+    """QueueListener that also accepts lists of records (see BatchingQueueHandler)"""
+    def handle(self, record):
+        if isinstance(record, list):
+            for batch_record in record:
+                super().handle(batch_record)
+        else:
+            super().handle(record)
+
+################################################################################
+# Shared memory log transport
+# Sizes in bytes
+RING_SIZE_DEFAULT = 1024 * 1024
+RING_POLL_INTERVAL_S = 0.001
+
+class ShmRingBuffer:
+    """Single producer, single consumer byte message ring in shared memory
+
+    Layout: write counter (head), read counter (tail), and capacity on separate
+    cache lines followed by the data region. Counters only increase so
+    used = head - tail and positions wrap modulo the capacity. Each message is
+    a 4 byte length followed by the payload and may wrap around the end.
+
+    The producer only writes head and the consumer only writes tail, so no lock
+    is needed as long as each ring has exactly one writer process.
+    """
+    _u64 = struct.Struct("<Q")
+    _msg_len = struct.Struct("<I")
+    _head_offset = 0
+    _tail_offset = 64
+    _capacity_offset = 128
+    _data_offset = 192
+
+    def __init__(self, size: int = RING_SIZE_DEFAULT, name: Optional[str] = None):
+        if name is None:
+            self.shm = SharedMemory(create=True, size=self._data_offset + size)
+            self._u64.pack_into(self.shm.buf, self._capacity_offset, size)
+        else:
+            self.shm = SharedMemory(name=name)
+        self.capacity = self._u64.unpack_from(self.shm.buf, self._capacity_offset)[0]
+
+    def __reduce__(self):
+        return (self.__class__, (self.capacity, self.shm.name))
+
+    def put(self, data: bytes, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """Write message. If full, wait for room (up to timeout if given) or
+        return False if not block or the timeout passes"""
+        msg = self._msg_len.pack(len(data)) + data
+        if len(msg) > self.capacity:
+            raise ValueError(f"Message of {len(msg)} bytes exceeds ring capacity")
+        buf = self.shm.buf
+        head = self._u64.unpack_from(buf, self._head_offset)[0]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.capacity - (head - self._u64.unpack_from(buf, self._tail_offset)[0]) < len(msg):
+            if not block or (deadline is not None and time.monotonic() > deadline):
+                return False
+            time.sleep(RING_POLL_INTERVAL_S)
+        self._copy_in(head, msg)
+        # Publish only after the payload is written
+        self._u64.pack_into(buf, self._head_offset, head + len(msg))
+        return True
+
+    def get_all(self) -> list[bytes]:
+        """Read all messages currently in the ring"""
+        buf = self.shm.buf
+        head = self._u64.unpack_from(buf, self._head_offset)[0]
+        tail = self._u64.unpack_from(buf, self._tail_offset)[0]
+        msgs = []
+        while tail < head:
+            n_bytes = self._msg_len.unpack(self._copy_out(tail, self._msg_len.size))[0]
+            msgs.append(self._copy_out(tail + self._msg_len.size, n_bytes))
+            tail += self._msg_len.size + n_bytes
+        self._u64.pack_into(buf, self._tail_offset, tail)
+        return msgs
+
+    def close(self, unlink: bool = False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    def _copy_in(self, pos: int, data: bytes):
+        start = self._data_offset + pos % self.capacity
+        n_first = min(len(data), self._data_offset + self.capacity - start)
+        self.shm.buf[start:start + n_first] = data[:n_first]
+        if n_first < len(data):
+            self.shm.buf[self._data_offset:self._data_offset + len(data) - n_first] = data[n_first:]
+
+    def _copy_out(self, pos: int, n_bytes: int) -> bytes:
+        start = self._data_offset + pos % self.capacity
+        n_first = min(n_bytes, self._data_offset + self.capacity - start)
+        data = bytes(self.shm.buf[start:start + n_first])
+        if n_first < n_bytes:
+            data += bytes(self.shm.buf[self._data_offset:self._data_offset + n_bytes - n_first])
+        return data
+
+class ShmLogQueue:
+    """Log record queue backed by one ShmRingBuffer per writer process
+
+    Drop-in replacement for the queue given to QueueHandler and QueueListener
+    (or start_log_listener). Each process that puts a record claims its own
+    ring the first time, so at most n_writers processes can log through it at
+    once. The ring of a process that has exited is reused by the next process
+    to claim one (e.g. workers replaced with maxtasksperchild or
+    WarmPool.resize).
+    Records are written pre-serialized in a compact binary form (see
+    encode_record) instead of as a pickled LogRecord, and the listener polls
+    all rings. put_nowait(None) from the owning process stops the listener
+    once all rings are drained.
+
+    Like the unbounded queues it replaces, put_nowait (used by QueueHandler)
+    never drops a record: when the ring is full it waits for the listener to
+    make room. put(block=False) or a put timeout raise queue.Full instead.
+    """
+    def __init__(self, n_writers: int, ring_size: int = RING_SIZE_DEFAULT):
+        self._rings = [ShmRingBuffer(ring_size) for _ in range(n_writers)]
+        # pid of the process writing to each ring, 0 if unclaimed
+        self._ring_pids = mp.Array("i", n_writers)
+        self._owner_pid = os.getpid()
+        self._writer_pid = None
+        self._writer = None
+        self._pending = deque()
+        self._stopping = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_writer_pid=None, _writer=None, _pending=deque())
+        return state
+
+    def put(self, record, block: bool = True, timeout=None):
+        """Put a record or list of records (see BatchingQueueHandler)"""
+        if record is None:
+            # Sentinel from QueueListener.stop or main_pool
+            self._stopping = True
+            return
+        if self._writer_pid != os.getpid():
+            self._writer = self._claim_ring()
+            self._writer_pid = os.getpid()
+        records = record if isinstance(record, list) else [record]
+        for record in records:
+            if not self._writer.put(encode_record(record), block=block, timeout=timeout):
+                raise queue.Full
+
+    def put_nowait(self, record: Optional[logging.LogRecord]):
+        # Full ring only means the listener is behind (see class docstring)
+        self.put(record)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Optional[logging.LogRecord]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._pending:
+            for ring in self._rings:
+                self._pending.extend(ring.get_all())
+            if self._pending:
+                break
+            if self._stopping:
+                return None
+            if not block or (deadline is not None and time.monotonic() > deadline):
+                raise queue.Empty
+            time.sleep(RING_POLL_INTERVAL_S)
+        return decode_record(self._pending.popleft())
+
+    def get_nowait(self) -> Optional[logging.LogRecord]:
+        return self.get(block=False)
+
+    def close(self):
+        for ring in self._rings:
+            ring.close(unlink=(os.getpid() == self._owner_pid))
+
+    def _claim_ring(self) -> ShmRingBuffer:
+        with self._ring_pids.get_lock():
+            for idx, pid in enumerate(self._ring_pids):
+                # A ring has a single writer so it is only free again once
+                # its writer has exited
+                if pid == 0 or not _pid_alive(pid):
+                    self._ring_pids[idx] = os.getpid()
+                    return self._rings[idx]
+        raise RuntimeError(
+            f"All {len(self._rings)} ShmLogQueue rings are claimed by running processes"
+        )
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# created, levelno, lineno, process, then the byte lengths of _record_str_attrs
+_record_header = struct.Struct("<diiiHHHHI")
+_record_str_attrs = ("name", "module", "funcName", "processName")
+
+def encode_record(record: logging.LogRecord) -> bytes:
+    """Compact binary encoding of the LogRecord attributes needed to format it"""
+    strs = [getattr(record, attr).encode() for attr in _record_str_attrs]
+    strs.append(record.getMessage().encode(errors="backslashreplace"))
+    header = _record_header.pack(
+        record.created, record.levelno, record.lineno, record.process, *map(len, strs)
+    )
+    return header + b"".join(strs)
+
+def decode_record(data: bytes) -> logging.LogRecord:
+    created, levelno, lineno, process, *lengths = _record_header.unpack_from(data)
+    attrs = dict(created=created, levelno=levelno, lineno=lineno, process=process)
+    pos = _record_header.size
+    for attr, n_bytes in zip((*_record_str_attrs, "msg"), lengths):
+        attrs[attr] = data[pos:pos + n_bytes].decode()
+        pos += n_bytes
+    attrs["levelname"] = logging.getLevelName(levelno)
+    attrs["msecs"] = (created - int(created)) * 1000
+    attrs["args"] = None
+    return logging.makeLogRecord(attrs)
+
 ################################################################################
 # Business logic
 def pow(num1, num2):
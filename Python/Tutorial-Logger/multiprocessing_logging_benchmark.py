@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the log record transports in multiprocessing_logging.py
+
+Run as
+>> python3 multiprocessing_logging_benchmark.py
+>> python3 multiprocessing_logging_benchmark.py --n-workers 2 8 --n-records 1000
+>> python3 multiprocessing_logging_benchmark.py --batch-size 100
+
+Each worker process logs n_records records through a QueueHandler and the main
+process handles them with a QueueListener. The time is measured from releasing
+the (already started) workers until the listener has handled every record.
+"""
+# Standard library
+import argparse
+import logging
+from logging.handlers import QueueHandler
+import multiprocessing as mp
+import time
+
+# Project
+from multiprocessing_logging import BatchingQueueHandler, BatchQueueListener, ShmLogQueue
+
+TRANSPORTS = ("manager", "mp_queue", "shm")
+
+
+################################################################################
+def benchmark_transports(n_workers_list: list[int], n_records: int, batch_size: int = 0):
+    print(f"Log records/s with {n_records} records per worker", end="")
+    print(f" in batches of {batch_size}" if batch_size else "")
+    print(f"{'transport':>10} | " + " | ".join(f"{n:>3} workers" for n in n_workers_list))
+    for transport in TRANSPORTS:
+        rates = [run_transport(transport, n, n_records, batch_size) for n in n_workers_list]
+        print(f"{transport:>10} | " + " | ".join(f"{r:11,.0f}" for r in rates))
+
+
+def run_transport(transport: str, n_workers: int, n_records: int, batch_size: int = 0) -> float:
+    if transport == "manager":
+        manager = mp.Manager()
+        queue = manager.Queue(-1)
+    elif transport == "mp_queue":
+        queue = mp.Queue(-1)
+    elif transport == "shm":
+        queue = ShmLogQueue(n_writers=n_workers)
+    else:
+        raise ValueError(f"Unknown transport: {transport}")
+
+    try:
+        counter = CountingHandler()
+        listener = BatchQueueListener(queue, counter)
+        listener.start()
+
+        start_event = mp.Event()
+        workers = [
+            mp.Process(target=_log_records, args=(queue, start_event, n_records, batch_size))
+            for _ in range(n_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        start = time.perf_counter()
+        start_event.set()
+        for worker in workers:
+            worker.join()
+        listener.stop()
+        duration = time.perf_counter() - start
+    finally:
+        if transport == "manager":
+            manager.shutdown()
+        elif transport == "shm":
+            queue.close()
+
+    assert counter.count == n_workers * n_records, f"{counter.count} records handled"
+    return counter.count / duration
+
+
+def _log_records(queue, start_event, n_records: int, batch_size: int):
+    log = logging.getLogger("benchmark")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    if batch_size:
+        handler = BatchingQueueHandler(queue, batch_size=batch_size)
+    else:
+        handler = QueueHandler(queue)
+    log.addHandler(handler)
+    start_event.wait()
+    for i in range(n_records):
+        log.info("Benchmark message %d", i)
+    handler.flush()
+
+
+class CountingHandler(logging.Handler):
+    """Formats records like a real handler but only counts them"""
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(logging.Formatter("%(levelname)8s | [%(processName)s] %(module)s :: %(message)s"))
+        self.count = 0
+
+    def emit(self, record):
+        self.format(record)
+        self.count += 1
+
+
+################################################################################
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-workers", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--n-records", type=int, default=2000, help="Records per worker")
+    parser.add_argument("--batch-size", type=int, default=0, help="0 to disable batching")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    benchmark_transports(args.n_workers, args.n_records, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
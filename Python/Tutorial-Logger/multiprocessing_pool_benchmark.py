@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the process pool helpers in multiprocessing_logging.py
+
+Run as
+>> python3 multiprocessing_pool_benchmark.py
+>> python3 multiprocessing_pool_benchmark.py dispatch --n-processes 4
+"""
+# Standard library
+import argparse
+import concurrent.futures as cf
+import multiprocessing as mp
+import time
+
+# Project
+from multiprocessing_logging import WarmPool, adaptive_imap_unordered, bounded_imap_unordered
+
+
+################################################################################
+# Benchmarks
+def benchmark_dispatch(n_processes: int, total_work_s: float = 0.5):
+    """imap_unordered (chunksize=1) vs adaptive_imap_unordered across task costs"""
+    task_costs_s = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1)
+    print(f"Wall time to run {total_work_s}s of CPU work per task cost on {n_processes} processes")
+    print(f"{'task cost':>10} | {'n_tasks':>7} | {'imap_unordered':>14} | {'adaptive':>14}")
+    with mp.Pool(n_processes) as pool:
+        for cost_s in task_costs_s:
+            n_tasks = max(2 * n_processes, round(total_work_s / cost_s))
+            args = [(i, cost_s) for i in range(n_tasks)]
+
+            start = time.perf_counter()
+            results = list(pool.imap_unordered(_busy_task, args))
+            duration_imap = time.perf_counter() - start
+            assert sorted(results) == [(x, x[0]) for x in args]
+
+            start = time.perf_counter()
+            results = list(adaptive_imap_unordered(pool, _busy_task, args))
+            duration_adaptive = time.perf_counter() - start
+            assert sorted(results) == [(x, x[0]) for x in args]
+
+            print(
+                f"{cost_s:>9g}s | {n_tasks:>7} | {duration_imap:>13.3f}s | {duration_adaptive:>13.3f}s"
+            )
+
+
+def benchmark_warm_pool(n_processes: int, n_rounds: int = 20, n_tasks: int = 100):
+    """New Pool per round of small tasks vs one WarmPool for all rounds"""
+    print(f"Wall time for {n_rounds} rounds of {n_tasks} small tasks on {n_processes} processes")
+    args = [(i, 1e-4) for i in range(n_tasks)]
+
+    start = time.perf_counter()
+    for _ in range(n_rounds):
+        with mp.Pool(n_processes) as pool:
+            list(pool.imap_unordered(_busy_task, args))
+    print(f"  {'New Pool per round':20} : {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    warm_pool = WarmPool(n_processes)
+    for _ in range(n_rounds):
+        list(warm_pool.imap_unordered(_busy_task, args))
+    warm_pool.shutdown()
+    print(f"  {'WarmPool':20} : {time.perf_counter() - start:.3f}s")
+
+
+def benchmark_backpressure(n_processes: int, n_tasks: int = 2000, payload_bytes: int = 1_000):
+    """Peak inputs read ahead of results for unbounded vs bounded dispatch"""
+    print(f"Peak pending inputs ({payload_bytes:,} bytes each) over {n_tasks} tasks on {n_processes} processes")
+    print(f"{'method':>36} | {'peak pending':>12} | {'peak MB':>8} | {'wall time':>9}")
+    with mp.Pool(n_processes) as pool, cf.ProcessPoolExecutor(n_processes) as executor:
+        candidates = {
+            "Pool.imap_unordered": lambda it: pool.imap_unordered(_payload_task, it),
+            "Executor.submit all + as_completed": lambda it: (
+                f.result() for f in cf.as_completed([executor.submit(_payload_task, x) for x in it])
+            ),
+            "bounded_imap_unordered(Pool)": lambda it: bounded_imap_unordered(pool, _payload_task, it),
+            "bounded_imap_unordered(Executor)": lambda it: bounded_imap_unordered(executor, _payload_task, it),
+        }
+        for name, run in candidates.items():
+            counter = PendingCounter()
+            start = time.perf_counter()
+            for _ in run(counter.iterate(n_tasks, payload_bytes)):
+                counter.n_done += 1
+            duration = time.perf_counter() - start
+            assert counter.n_done == n_tasks
+            peak_mb = counter.peak * payload_bytes / 10**6
+            print(f"{name:>36} | {counter.peak:>12} | {peak_mb:>8.1f} | {duration:>8.3f}s")
+
+
+class PendingCounter:
+    """Input generator tracking how many inputs were read but not yet returned"""
+    def __init__(self):
+        self.n_read = 0
+        self.n_done = 0
+        self.peak = 0
+
+    def iterate(self, n_tasks: int, payload_bytes: int):
+        for i in range(n_tasks):
+            self.n_read += 1
+            self.peak = max(self.peak, self.n_read - self.n_done)
+            yield i, bytes(payload_bytes)
+
+
+BENCHMARKS = {
+    "dispatch": benchmark_dispatch,
+    "warm_pool": benchmark_warm_pool,
+    "backpressure": benchmark_backpressure,
+}
+
+
+################################################################################
+# Worker functions following the (args, result) convention of _mp_pow
+def _busy_task(args):
+    x, cost_s = args
+    end = time.perf_counter() + cost_s
+    while time.perf_counter() < end:
+        pass
+    return args, x
+
+
+def _payload_task(args):
+    x, payload = args
+    time.sleep(1e-3)
+    return x, len(payload)
+
+
+################################################################################
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"Benchmarks to run (default: all). Options: {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument("--n-processes", type=int, default=mp.cpu_count())
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = get_args()
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.n_processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import logging
+import queue
+
+import multiprocessing_logging as mpl
+
+################################################################################
+# compute_log_levels / start_log_listener
+DICT_CONFIG = {
+    "version": 1,
+    "handlers": {
+        "file": {"class": "logging.NullHandler", "level": "INFO"},
+        "test": {"class": "logging.NullHandler", "level": "DEBUG"},
+    },
+    "loggers": {
+        "pkg": {"level": "DEBUG", "handlers": ["test"]},
+    },
+}
+
+def test_log_levels_match_what_listener_emits():
+    emitted = []
+    listener_handler = logging.Handler(logging.INFO)
+    listener_handler.emit = emitted.append
+    levels = mpl.compute_log_levels(DICT_CONFIG, [listener_handler])
+    assert levels == {"": logging.INFO, "pkg": logging.INFO}
+
+    log_queue = queue.Queue()
+    for levelno in (logging.DEBUG, logging.INFO):
+        log_queue.put(logging.makeLogRecord({"name": "pkg", "levelno": levelno}))
+    log_queue.put(None)
+    mpl.start_log_listener(log_queue, [listener_handler])
+    # A DEBUG threshold for "pkg" would only ship records the listener drops
+    assert [r.levelno for r in emitted] == [logging.INFO]
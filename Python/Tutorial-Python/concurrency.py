@@ -31,15 +31,28 @@
 # * Real Python : https://realpython.com/python-concurrency/
 # * Stackoverflow : https://stackoverflow.com/questions/49005651/how-does-asyncio-actually-work
 ################################################################################
+import sys
 import time
 import types
+import atexit
 import concurrent.futures
 import threading
 import asyncio
+import contextlib
+import functools
+import itertools
 import multiprocessing
-from typing import Callable, Awaitable, Any
+import multiprocessing.pool
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Awaitable, Any, AsyncIterable, AsyncIterator, Iterable, Iterator
 from statistics import mean
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Processes created by multiprocessing import __main__ so be cautious about globals
 #print(f'Loading concurrency.py from {__name__}')
 if __name__ == '__mp_main__':
@@ -64,10 +77,18 @@ def simple_synchronous_tasking(inputs: list[Any]) -> list[Any]:
     result = map(thread_func, inputs)
     return list(result)
 
-def simple_preemptive_multitasking(inputs: list[Any], max_threads: int) -> list[Any]:
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_threads) as executor:
+def simple_preemptive_multitasking(inputs: list[Any], max_threads: int, instrumented: bool = False) -> list[Any]:
+    if instrumented:
+        # Same but prints queue wait, run time and utilization of the pool
+        executor = InstrumentedThreadPoolExecutor(max_workers=max_threads)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_threads)
+    with executor:
         result = executor.map(thread_func, inputs)
-    return list(result)
+        result = list(result)
+    if instrumented:
+        print(executor_snapshot_str(executor.snapshot()))
+    return result
 
 def simple_cooperative_multitasking(inputs: list[Any], max_threads: int) -> list[Any]:
     awaitable = task_runner(inputs, max_threads)
@@ -78,12 +99,15 @@ async def task_runner(
     task_inputs: list[Any],
     max_threads: int = None
 ) -> Awaitable[list[Any]]:
-    awaitables = [coroutine_func(x) for x in task_inputs]
     if max_threads is None:
+        awaitables = [coroutine_func(x) for x in task_inputs]
         result = await asyncio.gather(*awaitables, return_exceptions=True)
     else:
         # Requires jumping through more hoops to limit task count
-        result = await limited_gather(max_threads, *awaitables, return_exceptions=True)
+        results = bounded_map(
+            coroutine_func, task_inputs, max_threads, ordered=True, return_exceptions=True
+        )
+        result = [x async for x in results]
     return result
 
 async def limited_gather(
@@ -92,6 +116,8 @@ async def limited_gather(
     **kwargs    : dict[str, Any],
 ) -> asyncio.Future[Any]:
     # See https://stackoverflow.com/questions/48483348/how-to-limit-concurrency-with-python-asyncio
+    # All awaitables exist up front and results only arrive at the end. See
+    # bounded_map for large or unbounded inputs.
     semaphore = asyncio.Semaphore(max_threads)
     async def sem_aw(awaitable):
         async with semaphore:
@@ -100,6 +126,79 @@ async def limited_gather(
     print(f'Controlled gather with max {max_threads} threads')
     return await asyncio.gather(*sem_aws, **kwargs)
 
+async def bounded_map(
+    func              : Callable[[Any], Awaitable],
+    inputs            : Iterable | AsyncIterable,
+    max_tasks         : int,
+    ordered           : bool = False,
+    timeout           : float = None,
+    return_exceptions : bool = False,
+) -> AsyncIterator[Any]:
+    '''Yield func(x) for each input with at most max_tasks running at once
+
+    Unlike limited_gather, inputs (a sync or async iterable) are only read and
+    their coroutines created as earlier tasks finish, and results are yielded
+    as they complete (or in input order if ordered) instead of all at the end.
+    In ordered mode results waiting on an earlier task count towards
+    max_tasks so memory stays bounded.
+
+    Each task is cancelled with a TimeoutError after timeout seconds. Errors
+    are raised unless return_exceptions, in which case they are yielded. Tasks
+    still running are cancelled if an error is raised or the caller stops
+    iterating early (e.g. break or aclose()).
+    '''
+    if max_tasks < 1:
+        raise ValueError(f'max_tasks must be >= 1: {max_tasks}')
+    if isinstance(inputs, AsyncIterable):
+        input_iter = aiter(inputs)
+    else:
+        input_iter = _async_iter(inputs)
+
+    pending: dict[asyncio.Task, int] = {} # Task -> input index
+    finished: dict[int, asyncio.Task] = {} # Results waiting on earlier inputs
+    n_started = 0
+    next_index = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) + len(finished) < max_tasks:
+                try:
+                    x = await anext(input_iter)
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                aw = func(x) if timeout is None else asyncio.wait_for(func(x), timeout)
+                pending[asyncio.create_task(aw)] = n_started
+                n_started += 1
+            if not pending:
+                return
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                finished[pending.pop(task)] = task
+            if ordered:
+                while next_index in finished:
+                    yield _task_result(finished.pop(next_index), return_exceptions)
+                    next_index += 1
+            else:
+                while finished:
+                    _, task = finished.popitem()
+                    yield _task_result(task, return_exceptions)
+    finally:
+        for task in pending:
+            task.cancel()
+        # Wait for cancellations and retrieve errors of tasks never yielded
+        await asyncio.gather(*pending, *finished.values(), return_exceptions=True)
+
+def _task_result(task: asyncio.Task, return_exceptions: bool) -> Any:
+    if return_exceptions and task.exception() is not None:
+        return task.exception()
+    return task.result()
+
+async def _async_iter(iterable: Iterable) -> AsyncIterator[Any]:
+    for x in iterable:
+        yield x
+
 # Dummy thread functions
 def thread_func(x: Any) -> Any:
     thread = threading.current_thread()
@@ -133,6 +232,9 @@ async def slow_aio_process(x: Any) -> str:
 
 # Utilities
 def get_thread_num(thread: threading.Thread) -> int:
+    if thread is threading.current_thread() and hasattr(_worker_local, 'worker_num'):
+        # Numbered by InstrumentedThreadPoolExecutor
+        return _worker_local.worker_num
     if thread.name.startswith('ThreadPoolExecutor'):
         # Example: ThreadPoolExecutor-0_11
         # user_prefix = int(thread.name.split('-')[1].split('_')[0])
@@ -143,10 +245,59 @@ def get_thread_num(thread: threading.Thread) -> int:
 
 ############################################################
 # Multiprocessing
-def slow_cpu_process(x):
+def slow_cpu_process(x, n_loops: int = 2 * 10**7):
     print(f'Running slow cpu process {x}')
     start = time.time()
-    _ = [n*2 for n in range(2 * 10**7)]
+    _ = [n*2 for n in range(n_loops)]
+    return round(time.time() - start,3)
+
+# Vectorized versions
+# The Python level loops above cost ~50ns per element, so more processes is
+# the only way to speed them up. NumPy does the same work in C in ~1ns per
+# element and processing the range in chunks keeps memory bounded. The
+# *_range kernels return the sum of their results mod 2**64 as a checksum so
+# variants can be compared.
+CHECKSUM_MOD = 2**64
+CPU_CHUNK_SIZE = 2**20
+
+def double_range(start: int, stop: int) -> int:
+    '''Pure Python kernel of slow_cpu_process'''
+    return sum([n*2 for n in range(start, stop)]) % CHECKSUM_MOD
+
+def double_range_vectorized(start: int, stop: int, chunk_size: int = CPU_CHUNK_SIZE) -> int:
+    total = 0
+    for lo in range(start, stop, chunk_size):
+        chunk = np.arange(lo, min(lo + chunk_size, stop), dtype=np.int64)
+        # uint64 sums wrap like the % CHECKSUM_MOD of the pure Python kernel
+        total += int((chunk * 2).sum(dtype=np.uint64))
+    return total % CHECKSUM_MOD
+
+def square_range(start: int, stop: int) -> int:
+    '''Pure Python kernel of slow_cpu_process_mp'''
+    return sum(a*a for a in range(start, stop)) % CHECKSUM_MOD
+
+def square_range_vectorized(start: int, stop: int, chunk_size: int = CPU_CHUNK_SIZE) -> int:
+    total = 0
+    for lo in range(start, stop, chunk_size):
+        chunk = np.arange(lo, min(lo + chunk_size, stop), dtype=np.int64)
+        total += int(square_array(chunk).sum(dtype=np.uint64))
+    return total % CHECKSUM_MOD
+
+def parallel_range(
+    pool     : multiprocessing.pool.Pool,
+    kernel   : Callable[[int, int], int],
+    n        : int,
+    n_chunks : int = None,
+) -> int:
+    '''Run kernel over range(n) split into n_chunks (default one per worker)'''
+    n_chunks = n_chunks or pool._processes
+    bounds = [n * i // n_chunks for i in range(n_chunks + 1)]
+    return sum(pool.starmap(kernel, zip(bounds[:-1], bounds[1:]))) % CHECKSUM_MOD
+
+def slow_cpu_process_vectorized(x, n_loops: int = 2 * 10**7):
+    print(f'Running vectorized cpu process {x}')
+    start = time.time()
+    _ = double_range_vectorized(0, n_loops)
     return round(time.time() - start,3)
 
 # Synchronous version
@@ -154,11 +305,78 @@ def simple_synchronous_processing():
     result = [slow_cpu_process(n) for n in range(n_processes)]
     print(result)
 
-def simple_multiprocessing():
-    with multiprocessing.Pool() as pool:
-        result = pool.map(slow_cpu_process, range(n_processes))
+def simple_multiprocessing(warm: bool = False):
+    if warm:
+        # Reuse workers across calls instead of spawning them every time
+        result = warm_pool.map(slow_cpu_process, range(n_processes))
+    else:
+        with multiprocessing.Pool() as pool:
+            result = pool.map(slow_cpu_process, range(n_processes))
     print(result)
 
+class WarmPool:
+    '''Process pool started on first use and reused until shutdown
+
+    Creating a Pool spawns every worker, which costs more than many small
+    rounds of tasks. A WarmPool keeps the same workers across calls. Pool
+    methods (map, imap_unordered, apply_async, ...) are forwarded to the
+    underlying Pool, which is created on first use. resize() replaces the
+    workers after outstanding tasks finish and the pool is shut down at exit.
+    Same design as WarmPool in Tutorial-Logger/multiprocessing_logging.py.
+    '''
+    def __init__(self, processes: int = None, initializer=None, initargs=()):
+        # Same name as the Pool attribute so code reading pool._processes works
+        self._processes = processes or multiprocessing.cpu_count()
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def __getattr__(self, name):
+        # Only forward public Pool attributes (also avoids recursion on
+        # attributes missing during unpickling/copying)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.pool, name)
+
+    @property
+    def pool(self) -> multiprocessing.pool.Pool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(
+                    processes=self._processes,
+                    initializer=self._initializer,
+                    initargs=self._initargs,
+                )
+            return self._pool
+
+    def resize(self, processes: int):
+        '''Change number of workers. Waits for outstanding tasks to finish'''
+        with self._lock:
+            if processes == self._processes:
+                return
+            old_pool, self._pool = self._pool, None
+            self._processes = processes
+        if old_pool is not None:
+            old_pool.close()
+            old_pool.join()
+
+    def shutdown(self, wait: bool = True):
+        '''Stop workers. If wait, let them finish outstanding tasks first'''
+        with self._lock:
+            old_pool, self._pool = self._pool, None
+        if old_pool is None:
+            return
+        if wait:
+            old_pool.close()
+        else:
+            old_pool.terminate()
+        old_pool.join()
+
+# Shared by the examples below. Workers are only spawned on first use
+warm_pool = WarmPool()
+
 ################################################################################
 # Advanced asyncio
 ################################################################################
@@ -309,35 +527,132 @@ async def advanced_cooperative_multitasking():
 
 async def test_read_and_write():
     # How to read from multiple files at once and write to a single file
-    async def read_and_write_after(msec, ifile, ofile):
+    async def read_and_write_after(msec, ifile, writer):
         text = await slow_file_read(msec, ifile)
         text = process_text(text)
-        write_to_file(text, ofile)
+        await writer.write(text)
 
     async def slow_file_read(msec, ifile_path):
-        with open(ifile_path, 'r') as ifile:
-            await asyncio.sleep(msec/1000)
-            text = ifile.read()
-        return text
+        await asyncio.sleep(msec/1000)
+        # open() and read() block so run them in a thread
+        return await read_file_async(ifile_path)
 
     def process_text(text):
         return 'Processed ' + text
 
-    def write_to_file(text, ofile_path):
-        with open(ofile_path, 'a+') as ofile:
-            #time.sleep(0.001)
-            ofile.write(text)
-
-    coro_objs = [
-        read_and_write_after(1,'test_files/input_file1.txt', 'output_file.txt'),
-        read_and_write_after(0,'test_files/input_file2.txt', 'output_file.txt'),
-        read_and_write_after(3,'test_files/input_file3.txt', 'output_file.txt'),
-        read_and_write_after(2,'test_files/input_file4.txt', 'output_file.txt'),
-    ]
+    # One writer task owns the output file so concurrent writes never
+    # interleave and the event loop never blocks on disk
+    async with AsyncFileWriter('output_file.txt', 'a+') as writer:
+        coro_objs = [
+            read_and_write_after(1,'test_files/input_file1.txt', writer),
+            read_and_write_after(0,'test_files/input_file2.txt', writer),
+            read_and_write_after(3,'test_files/input_file3.txt', writer),
+            read_and_write_after(2,'test_files/input_file4.txt', writer),
+        ]
+        await asyncio.gather(*coro_objs)
+    print(await read_file_async('output_file.txt'))
 
-    await asyncio.gather(*coro_objs)
-    with open('output_file.txt','r') as ifile:
-        print(ifile.read())
+############################################################
+# Async file I/O
+# The standard library has no async file API (io_uring/aio are not exposed) so
+# blocking calls run in the default thread pool executor.
+async def read_file_async(path: str, mode: str = 'r') -> str | bytes:
+    def read():
+        with open(path, mode) as ifile:
+            return ifile.read()
+    return await asyncio.to_thread(read)
+
+class AsyncFileWriter:
+    '''Serialized, batched writes to one file from many coroutines
+
+    write() only queues the text. A single writer task joins whatever is
+    queued (up to batch_size items) and writes it with one call in a
+    thread, so each write() lands whole and the event loop never blocks on
+    disk. write() waits while max_queued items are pending (backpressure).
+
+    >> async with AsyncFileWriter('out.txt') as writer:
+    >>     await writer.write('text')
+    '''
+    _CLOSE = object() # Queue sentinel
+
+    def __init__(self, path: str, mode: str = 'w', batch_size: int = 1000, max_queued: int = 10_000):
+        self.path = path
+        self.mode = mode
+        self.batch_size = batch_size
+        self._queue = asyncio.Queue(max_queued)
+        self._file = None
+        self._writer_task = None
+        self.n_writes = 0 # File write calls (batches)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        self._file = await asyncio.to_thread(open, self.path, self.mode)
+        self._writer_task = asyncio.create_task(self._write_batches())
+
+    async def write(self, text: str):
+        if self._writer_task is None or self._writer_task.done():
+            # Surface errors from the writer task instead of queueing forever
+            if self._writer_task is not None:
+                self._writer_task.result()
+            raise ValueError(f'{self.path} is not open for writing')
+        if self._queue.full():
+            await self._until_writer_done(self._queue.put(text))
+        else:
+            self._queue.put_nowait(text)
+
+    async def flush(self):
+        '''Wait until all queued text is written and flushed to the OS'''
+        if self._writer_task is None:
+            return
+        await self._until_writer_done(self._queue.join())
+
+    async def _until_writer_done(self, awaitable: Awaitable):
+        '''Await awaitable, raising the writer task's error if it stops first'''
+        waiter = asyncio.ensure_future(awaitable)
+        await asyncio.wait([waiter, self._writer_task], return_when=asyncio.FIRST_COMPLETED)
+        if waiter.done():
+            return waiter.result()
+        waiter.cancel()
+        self._writer_task.result()
+        raise ValueError(f'{self.path} was closed while waiting')
+
+    async def close(self):
+        if self._writer_task is None:
+            return
+        try:
+            if not self._writer_task.done():
+                # The queue may be full with the writer task failing
+                await self._until_writer_done(self._queue.put(self._CLOSE))
+            await self._writer_task
+        finally:
+            self._writer_task = None
+            await asyncio.to_thread(self._file.close)
+
+    async def _write_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            closing = batch[-1] is self._CLOSE
+            if closing:
+                batch.pop()
+            if batch:
+                await asyncio.to_thread(self._write, ''.join(batch))
+                self.n_writes += 1
+            for _ in range(len(batch) + closing):
+                self._queue.task_done()
+            if closing:
+                return
+
+    def _write(self, text: str):
+        self._file.write(text)
+        self._file.flush()
 
 ################################################################################
 # Advanced threading
@@ -367,9 +682,262 @@ def example_race_condition():
     for ii, result in enumerate(results):
         print(f'\tRace {ii+1}) Input {result}')
 
-#import threading
-#lock = Lock()
-#thread_local = threading.local()
+########################################
+# Contended aggregation without a shared lock
+# Guarding shared_resource with one Lock makes every thread wait on every
+# other. Instead each thread updates its own shard (from threading.local) with
+# no lock and readers merge all shards, which is cheap when reads are rare
+# compared to updates (e.g. metrics).
+class ShardedAccumulator:
+    '''Per-thread state that is merged on read
+
+    factory() creates a thread's state on its first use and merge(total,
+    state) folds each state into the result of value(). Each state has its own
+    lock, held by updating() in the owning thread and by value() while merging
+    that state, so mutable states (e.g. a Counter) are never read mid update.
+    The lock is only contended while value() runs. value() may miss updates
+    made while it runs.
+
+    >> acc = ShardedAccumulator(collections.Counter, operator.add)
+    >> with acc.updating() as counts: # From any thread
+    >>     counts['key'] += 1
+    >> acc.value()                    # Counter summed over threads
+    '''
+    def __init__(self, factory: Callable[[], Any], merge: Callable[[Any, Any], Any]):
+        self._factory = factory
+        self._merge = merge
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock() # Only guards adding shards
+
+    def _shard(self) -> tuple[threading.Lock, Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = (threading.Lock(), self._factory())
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def local(self) -> Any:
+        '''This thread's state. Only modify it inside updating()'''
+        return self._shard()[1]
+
+    @contextlib.contextmanager
+    def updating(self) -> Iterator[Any]:
+        '''This thread's state with its lock held'''
+        lock, state = self._shard()
+        with lock:
+            yield state
+
+    def value(self) -> Any:
+        total = self._factory()
+        for lock, state in self.shards():
+            with lock:
+                total = self._merge(total, state)
+        return total
+
+    def shards(self) -> list[tuple[threading.Lock, Any]]:
+        '''(lock, state) of each thread. Hold the lock while reading the state'''
+        with self._lock:
+            return list(self._shards)
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._shards)
+
+class ShardedCounter(ShardedAccumulator):
+    '''Integer counter where each thread increments its own shard'''
+    def __init__(self):
+        # One element lists so shards can be updated in place
+        super().__init__(lambda: [0], lambda total, shard: [total[0] + shard[0]])
+
+    def add(self, n: int = 1):
+        # No lock needed: value() only reads the int, which is replaced whole
+        self.local()[0] += n
+
+    def value(self) -> int:
+        return super().value()[0]
+
+class LockedCounter:
+    '''Integer counter guarded by a single Lock (for comparison)'''
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def add(self, n: int = 1):
+        with self._lock:
+            self._value += n
+
+    def value(self) -> int:
+        with self._lock:
+            return self._value
+
+def example_sharded_counter():
+    print('\nSharded counter')
+    for counter in (ShardedCounter(), LockedCounter()):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_threads) as executor:
+            executor.map(lambda x: counter.add(x), race_inputs)
+        expected = sum(race_inputs)
+        print(f'{type(counter).__name__}: sum of {n_race_inputs} inputs on {max_threads} threads = '
+              f'{counter.value()} (expected {expected})')
+
+########################################
+# Thread pool telemetry
+class Histogram:
+    '''Counts of durations in power of 2 microsecond buckets
+
+    Bucket i counts durations in [2**(i-1), 2**i) us (bucket 0 is < 1us) so
+    adding is O(1) and percentiles are accurate to a factor of 2.
+    '''
+    N_BUCKETS = 40 # Last bucket is >= ~3 days
+
+    def __init__(self):
+        self.counts = [0] * self.N_BUCKETS
+
+    def add(self, duration_s: float):
+        bucket = int(duration_s * 10**6).bit_length()
+        self.counts[min(bucket, self.N_BUCKETS - 1)] += 1
+
+    def merged(self, other: 'Histogram') -> 'Histogram':
+        hist = Histogram()
+        hist.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return hist
+
+    @property
+    def n(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, pct: float) -> float:
+        '''Upper edge (seconds) of the bucket holding the pct percentile'''
+        n = self.n
+        if n == 0:
+            return 0.0
+        rank = pct / 100 * n
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return 2**bucket / 10**6
+        return 2**(self.N_BUCKETS - 1) / 10**6
+
+    def as_dict(self) -> dict[str, int]:
+        '''Non-empty buckets keyed by upper edge'''
+        return {f'<{2**i}us': count for i, count in enumerate(self.counts) if count}
+
+class WorkerStats:
+    '''Task timings of one InstrumentedThreadPoolExecutor worker thread'''
+    def __init__(self):
+        self.worker_num = None
+        self.n_tasks = 0
+        self.busy_s = 0.0
+        self.running_since = None
+        self.wait = Histogram() # Time from submit() to start
+        self.run = Histogram()
+
+    def merged(self, other: 'WorkerStats') -> 'WorkerStats':
+        stats = WorkerStats()
+        stats.n_tasks = self.n_tasks + other.n_tasks
+        stats.busy_s = self.busy_s + other.busy_s
+        stats.wait = self.wait.merged(other.wait)
+        stats.run = self.run.merged(other.run)
+        return stats
+
+# Worker number of the current InstrumentedThreadPoolExecutor thread
+_worker_local = threading.local()
+
+class InstrumentedThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    '''ThreadPoolExecutor that records queue wait and run time of each task
+
+    Workers are numbered 1..max_workers as they start (see get_thread_num) and
+    record into their own WorkerStats shard (see ShardedAccumulator), so
+    telemetry adds no lock contention between tasks. Each shard's lock is only
+    shared with snapshot(). snapshot() can be called
+    at any time, including while tasks run, to tune max_workers from
+    utilization and queue wait. Utilization is measured from executor creation.
+    '''
+    def __init__(self, max_workers=None, thread_name_prefix='', initializer=None, initargs=()):
+        self._worker_nums = itertools.count(1)
+        self._user_initializer = initializer
+        self._worker_stats = ShardedAccumulator(WorkerStats, WorkerStats.merged)
+        self._n_submitted = ShardedCounter()
+        self._created = time.perf_counter()
+        super().__init__(max_workers, thread_name_prefix, self._init_worker, initargs)
+
+    def _init_worker(self, *initargs):
+        with self._worker_stats.updating() as stats:
+            stats.worker_num = _worker_local.worker_num = next(self._worker_nums)
+        if self._user_initializer is not None:
+            self._user_initializer(*initargs)
+
+    def submit(self, fn, /, *args, **kwargs) -> concurrent.futures.Future:
+        self._n_submitted.add()
+        return super().submit(self._run_task, time.perf_counter(), fn, args, kwargs)
+
+    def _run_task(self, submitted: float, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        with self._worker_stats.updating() as stats:
+            start = stats.running_since = time.perf_counter()
+            stats.wait.add(start - submitted)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._worker_stats.updating() as stats:
+                duration = time.perf_counter() - start
+                stats.run.add(duration)
+                stats.busy_s += duration
+                stats.n_tasks += 1
+                stats.running_since = None
+
+    def snapshot(self) -> dict[str, Any]:
+        workers = self._worker_stats.shards()
+        total = WorkerStats()
+        n_running = 0
+        worker_busy_s = {}
+        for lock, w in workers:
+            # Each worker's counters, histograms, and running task read together
+            with lock:
+                now = time.perf_counter()
+                total = total.merged(w)
+                n_running += w.running_since is not None
+                worker_busy_s[w.worker_num] = w.busy_s + (
+                    now - w.running_since if w.running_since is not None else 0
+                )
+        elapsed_s = time.perf_counter() - self._created
+        percentiles = lambda hist: {
+            'p50': hist.percentile(50), 'p90': hist.percentile(90), 'p99': hist.percentile(99),
+        }
+        return {
+            'elapsed_s'          : elapsed_s,
+            'max_workers'        : self._max_workers,
+            'n_workers'          : len(workers),
+            'n_submitted'        : (n_submitted := self._n_submitted.value()),
+            'n_done'             : total.n_tasks,
+            'n_running'          : n_running,
+            'n_queued'           : max(0, n_submitted - total.n_tasks - n_running),
+            # Unstarted workers count as idle
+            'utilization'        : sum(worker_busy_s.values()) / (elapsed_s * self._max_workers),
+            'worker_utilization' : {num: busy / elapsed_s for num, busy in sorted(worker_busy_s.items())},
+            'wait_s'             : percentiles(total.wait) | {'histogram': total.wait.as_dict()},
+            'run_s'              : percentiles(total.run) | {'histogram': total.run.as_dict()},
+        }
+
+def executor_snapshot_str(snapshot: dict[str, Any]) -> str:
+    s  = f'Executor Snapshot - {snapshot["n_workers"]}/{snapshot["max_workers"]} workers'
+    s += f'\n - Tasks       : submitted = {snapshot["n_submitted"]}; done = {snapshot["n_done"]}'
+    s += f'; running = {snapshot["n_running"]}; queued = {snapshot["n_queued"]}'
+    s += f'\n - Utilization : {snapshot["utilization"]:.1%} over {snapshot["elapsed_s"]:.3f}s'
+    for name in ('wait_s', 'run_s'):
+        p = snapshot[name]
+        s += f'\n - {name[:-2].title():11} : p50 <= {p["p50"]:.2e}s; p90 <= {p["p90"]:.2e}s; p99 <= {p["p99"]:.2e}s'
+    return s
+
+def example_instrumented_executor(n_tasks: int = 20):
+    print('\nInstrumented thread pool')
+    inputs = list(range(n_tasks))
+    for n_threads in (1, 2, 4, 8, 16):
+        with InstrumentedThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(slow_io_process, inputs))
+            print(executor_snapshot_str(executor.snapshot()))
 
 ########################################
 # Manually starting threads
@@ -427,6 +995,13 @@ def test_multiprocessing_performance_gain():
     duration = round(time.time() - start, 3)
     print(f'Setup Overhead: {duration}s\n')
 
+    print('Time overhead when reusing warm processes')
+    warm_pool.map(just_print, inputs) # Spawn workers
+    start = time.time()
+    _ = warm_pool.map(just_print, inputs)
+    duration = round(time.time() - start, 3)
+    print(f'Warm Pool Overhead: {duration}s\n')
+
     ############################################################################
     print('Running slow CPU processes with single process')
     start = time.time()
@@ -475,7 +1050,351 @@ def test_multiprocessing_performance_gain():
     diff_perc = diff / avg_time
     print(f'{diff_perc:.3%} diff in time per process '
            'between single and multiprocess for IO bound processes')
-    
+
+############################################################
+# Zero-copy array arguments with shared memory
+# Pool arguments and results are pickled and sent through a pipe, which for
+# large arrays costs more than the work done on them. Instead the array is put
+# in a shared memory block once and only a small handle is sent to workers,
+# which map the block as an array without copying.
+# Whether this process started its own resource tracker (see SharedArray.attach)
+_own_resource_tracker = None
+
+class SharedArray:
+    '''Picklable handle (name, shape, dtype) to an array in shared memory
+
+    Create handles with SharedArrays in the parent process, which owns and
+    unlinks the blocks. Workers only attach to them with attach().
+    '''
+    def __init__(self, name: str, shape: tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+
+    def __repr__(self):
+        return f'SharedArray({self.name!r}, shape={self.shape}, dtype={self.dtype!r})'
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+    @contextlib.contextmanager
+    def attach(self) -> Iterator['np.ndarray']:
+        '''Map the block as an array (no copy). Don't keep references after exit'''
+        # Workers normally share the parent's resource tracker, where
+        # registering the block again is a no-op. Workers forked before the
+        # parent first used shared memory start their own tracker instead,
+        # which would unlink the block when the worker exits.
+        global _own_resource_tracker
+        if sys.version_info >= (3, 13):
+            shm = SharedMemory(name=self.name, track=False)
+        else:
+            if _own_resource_tracker is None:
+                _own_resource_tracker = resource_tracker._resource_tracker._fd is None
+            shm = SharedMemory(name=self.name)
+            if _own_resource_tracker:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        try:
+            yield np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+        finally:
+            try:
+                shm.close()
+            except BufferError:
+                # The caller still references the array. The mapping is closed
+                # when that reference is garbage collected
+                pass
+
+class SharedArrays:
+    '''Owner of shared memory arrays that unlinks all of them on exit
+
+    Blocks are created and unlinked only here in the parent process so a
+    worker crashing mid task leaks nothing. If the parent itself is killed the
+    multiprocessing resource tracker unlinks the blocks.
+
+    >> with SharedArrays() as arrays:
+    >>     x = arrays.from_array(data)
+    >>     y = arrays.empty(data.shape, data.dtype)
+    >>     pool.map(func, [(x, y, i) for i in ...])
+    >>     result = arrays.to_array(y)
+    '''
+    def __init__(self):
+        if np is None:
+            raise ImportError('SharedArrays requires the numpy package')
+        self._blocks: dict[str, SharedMemory] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def empty(self, shape: tuple[int, ...], dtype='float64') -> SharedArray:
+        dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+        shm = SharedMemory(create=True, size=nbytes)
+        self._blocks[shm.name] = shm
+        return SharedArray(shm.name, shape, dtype.str)
+
+    def from_array(self, array: 'np.ndarray') -> SharedArray:
+        '''Copy array into a new block (the only copy made)'''
+        handle = self.empty(array.shape, array.dtype)
+        self.view(handle)[...] = array
+        return handle
+
+    def view(self, handle: SharedArray) -> 'np.ndarray':
+        '''Array backed by the block. Only valid until close()'''
+        shm = self._blocks[handle.name]
+        return np.ndarray(handle.shape, dtype=handle.dtype, buffer=shm.buf)
+
+    def to_array(self, handle: SharedArray) -> 'np.ndarray':
+        '''Copy of the array that stays valid after close()'''
+        return self.view(handle).copy()
+
+    def close(self):
+        while self._blocks:
+            _, shm = self._blocks.popitem()
+            try:
+                shm.close()
+            except BufferError:
+                # A view is still referenced. Unlinking below still frees the
+                # block once that view is garbage collected
+                pass
+            shm.unlink()
+
+def square_array(array: 'np.ndarray') -> 'np.ndarray':
+    '''Vectorized equivalent of the a*a loop in slow_cpu_process_mp'''
+    return array * array
+
+def _mp_square_shared(args):
+    '''Square rows [start, stop) of a shared input into a shared output
+
+    Follows the (args, result) convention of _mp_pow. Only the handles are
+    pickled and the result is written in place.
+    '''
+    x, out, start, stop = args
+    with x.attach() as x_array, out.attach() as out_array:
+        np.multiply(x_array[start:stop], x_array[start:stop], out=out_array[start:stop])
+        del x_array, out_array
+    return args, None
+
+def shared_memory_square(pool: multiprocessing.pool.Pool, array: 'np.ndarray', n_chunks: int = None) -> 'np.ndarray':
+    '''square_array split across pool workers with arrays in shared memory'''
+    n_chunks = n_chunks or pool._processes
+    bounds = np.linspace(0, len(array), n_chunks + 1, dtype=int)
+    with SharedArrays() as arrays:
+        x = arrays.from_array(array)
+        out = arrays.empty(array.shape, array.dtype)
+        tasks = [(x, out, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        pool.map(_mp_square_shared, tasks)
+        return arrays.to_array(out)
+
+################################################################################
+# Hybrid asyncio + process pool pipeline
+################################################################################
+class Stage:
+    '''One step of a Pipeline
+
+    kind='io' stages run coroutine functions on the event loop and regular
+    functions in a thread pool. kind='cpu' stages run func in a process pool
+    so it must be picklable (module level function or functools.partial).
+    concurrency is the number of items the stage works on at once and
+    queue_size bounds the queue of items waiting for this stage.
+    '''
+    def __init__(
+        self,
+        name        : str,
+        func        : Callable,
+        kind        : str = 'io',
+        concurrency : int = 1,
+        queue_size  : int = None,
+    ):
+        if kind not in ('io', 'cpu'):
+            raise ValueError(f'Unknown stage kind: {kind}')
+        if kind == 'cpu' and asyncio.iscoroutinefunction(func):
+            raise ValueError(f'cpu stage {name} must be a regular function')
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.concurrency = concurrency
+        self.queue_size = queue_size or 2 * concurrency
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, kind={self.kind!r}, concurrency={self.concurrency})'
+
+class StageMetrics:
+    '''Counts and timings of one Pipeline stage'''
+    def __init__(self, name: str):
+        self.name = name
+        self.n_items = 0
+        self.busy_s = 0.0 # Summed over concurrent calls
+        self.max_queue_depth = 0
+        self._queue_depth_sum = 0
+        self.elapsed_s = 0.0
+
+    def record(self, duration_s: float, queue_depth: int):
+        self.n_items += 1
+        self.busy_s += duration_s
+        self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+        self._queue_depth_sum += queue_depth
+
+    @property
+    def mean_queue_depth(self) -> float:
+        return self._queue_depth_sum / self.n_items if self.n_items else 0.0
+
+    @property
+    def throughput(self) -> float:
+        '''Items per second over the pipeline run'''
+        return self.n_items / self.elapsed_s if self.elapsed_s else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'name'             : self.name,
+            'n_items'          : self.n_items,
+            'busy_s'           : self.busy_s,
+            'throughput'       : self.throughput,
+            'max_queue_depth'  : self.max_queue_depth,
+            'mean_queue_depth' : self.mean_queue_depth,
+        }
+
+class Pipeline:
+    '''Chain of stages connected by bounded queues
+
+    Each stage has concurrency workers that take items from the stage's
+    queue and put func(item) on the next stage's queue, so a slow stage
+    applies backpressure to the ones before it instead of items piling up in
+    memory. Results are yielded by run() in completion order.
+
+    >> pipeline = Pipeline([
+    >>     Stage('fetch', slow_aio_process, 'io', concurrency=8),
+    >>     Stage('parse', slow_cpu_process, 'cpu', concurrency=n_processors),
+    >> ])
+    >> async for result in pipeline.run(inputs):
+    >>     ...
+    >> print(pipeline_summary_str(pipeline.metrics))
+    '''
+    _DONE = object() # Queue sentinel. Never crosses a process boundary
+
+    def __init__(self, stages: list[Stage]):
+        if not stages:
+            raise ValueError('Pipeline needs at least one stage')
+        self.stages = stages
+        self.metrics = [StageMetrics(stage.name) for stage in stages]
+
+    async def run(self, inputs: Iterable | AsyncIterable) -> AsyncIterator[Any]:
+        self.metrics = [StageMetrics(stage.name) for stage in self.stages]
+        queues = [asyncio.Queue(stage.queue_size) for stage in self.stages]
+        output_queue = asyncio.Queue(self.stages[-1].queue_size)
+        executors = [self._make_executor(stage) for stage in self.stages]
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(self._feed(inputs, queues[0]))]
+        for stage, executor, metrics, in_queue, out_queue in zip(
+            self.stages, executors, self.metrics, queues, queues[1:] + [output_queue]
+        ):
+            tasks.append(asyncio.create_task(
+                self._run_stage(stage, executor, metrics, in_queue, out_queue)
+            ))
+        get = None
+        running = list(tasks)
+        try:
+            while True:
+                if get is None:
+                    get = asyncio.create_task(output_queue.get())
+                # Wake up on a result or on a stage failing, until the output
+                # is drained
+                await asyncio.wait([get, *running], return_when=asyncio.FIRST_COMPLETED)
+                for task in running:
+                    if task.done() and task.exception() is not None:
+                        raise task.exception()
+                running = [task for task in running if not task.done()]
+                if not get.done():
+                    continue
+                item, get = get.result(), None
+                if item is self._DONE:
+                    break
+                yield item
+        finally:
+            if get is not None:
+                get.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for executor in executors:
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+            elapsed_s = time.perf_counter() - start
+            for metrics in self.metrics:
+                metrics.elapsed_s = elapsed_s
+
+    @staticmethod
+    def _make_executor(stage: Stage) -> concurrent.futures.Executor | None:
+        if stage.kind == 'cpu':
+            return concurrent.futures.ProcessPoolExecutor(stage.concurrency)
+        if not asyncio.iscoroutinefunction(stage.func):
+            return concurrent.futures.ThreadPoolExecutor(stage.concurrency)
+        return None
+
+    async def _feed(self, inputs: Iterable | AsyncIterable, queue: asyncio.Queue):
+        if isinstance(inputs, AsyncIterable):
+            async for x in inputs:
+                await queue.put(x)
+        else:
+            for x in inputs:
+                await queue.put(x)
+        await queue.put(self._DONE)
+
+    async def _run_stage(
+        self,
+        stage     : Stage,
+        executor  : concurrent.futures.Executor | None,
+        metrics   : StageMetrics,
+        in_queue  : asyncio.Queue,
+        out_queue : asyncio.Queue,
+    ):
+        async def worker():
+            loop = asyncio.get_running_loop()
+            while True:
+                queue_depth = in_queue.qsize()
+                item = await in_queue.get()
+                if item is self._DONE:
+                    # Put back for the other workers of this stage
+                    await in_queue.put(item)
+                    return
+                start = time.perf_counter()
+                if executor is None:
+                    result = await stage.func(item)
+                else:
+                    result = await loop.run_in_executor(executor, stage.func, item)
+                metrics.record(time.perf_counter() - start, queue_depth)
+                await out_queue.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(stage.concurrency)))
+        await out_queue.put(self._DONE)
+
+def pipeline_summary_str(metrics: list[StageMetrics]) -> str:
+    ostr = f'{"stage":>10} | {"items":>6} | {"items/s":>8} | {"busy":>8} | {"queue max":>9} | {"queue mean":>10}\n'
+    for m in metrics:
+        ostr += (
+            f'{m.name:>10} | {m.n_items:>6} | {m.throughput:>8.1f} | {m.busy_s:>7.2f}s'
+            f' | {m.max_queue_depth:>9} | {m.mean_queue_depth:>10.1f}\n'
+        )
+    return ostr
+
+def example_pipeline(n_inputs: int = 20, n_loops: int = 2 * 10**6):
+    '''Chain slow_aio_process style fetches into slow_cpu_process style work'''
+    async def run():
+        pipeline = Pipeline([
+            Stage('fetch', slow_aio_process, 'io', concurrency=8),
+            Stage('parse', functools.partial(slow_cpu_process, n_loops=n_loops), 'cpu', concurrency=n_processors),
+        ])
+        results = [x async for x in pipeline.run(range(n_inputs))]
+        return results, pipeline.metrics
+
+    start = time.time()
+    results, metrics = asyncio.run(run())
+    duration = time.time() - start
+    print(f'Pipeline processed {len(results)} inputs in {duration:.3f} seconds')
+    print(pipeline_summary_str(metrics))
+
 def main():
     # inputs = list(range(n_inputs))
     # print(f'Input: {inputs}')
@@ -523,7 +1442,12 @@ def main():
     #print('\nDemo of multiprocessing performance gains')
     #test_multiprocessing_performance_gain()
 
+    #print('\nHybrid asyncio + process pool pipeline')
+    #example_pipeline()
+
     #example_race_condition()
+    #example_sharded_counter()
+    #example_instrumented_executor()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+'''
+Benchmarks for the helpers in concurrency.py
+
+Run as
+>> python3 concurrency_benchmark.py                  # Run all benchmarks
+>> python3 concurrency_benchmark.py shared_memory    # Run a single benchmark
+>> python3 concurrency_benchmark.py shared_memory --max-mb 100
+>> python3 concurrency_benchmark.py workloads --workloads cpu io --n-workers 1 2 4 --json report.json
+>> python3 concurrency_benchmark.py contention --n-threads 2 8 64
+>> python3 concurrency_benchmark.py vectorized --max-n 10000000
+
+The workloads benchmark runs the slow_*_process functions of concurrency.py
+on each executor (sync, thread, process, asyncio) and worker count. Each
+configuration is warmed up and then timed over several repetitions. Speedup
+is relative to the single worker baseline and efficiency is speedup per
+worker.
+'''
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+import concurrency
+
+################################################################################
+# Benchmarks
+def benchmark_shared_memory(args: argparse.Namespace):
+    '''Pickled vs shared memory array arguments and results for a process pool'''
+    n_processes = args.n_processes
+    sizes_mb = [mb for mb in (1, 10, 100, 1024) if mb <= args.max_mb]
+    print(f'Wall time to square float64 arrays split across {n_processes} processes')
+    print(f'{"size":>8} | {"pickled":>9} | {"shared":>9} | {"speedup":>7}')
+    with multiprocessing.Pool(n_processes) as pool:
+        pool.map(concurrency.just_print, range(n_processes)) # Spawn workers
+        for size_mb in sizes_mb:
+            array = np.random.default_rng(0).random(size_mb * 2**20 // 8)
+            # Spot check results to keep memory use down for large arrays
+            idx = np.random.default_rng(1).integers(len(array), size=1000)
+            expected = concurrency.square_array(array[idx])
+
+            start = time.perf_counter()
+            chunks = pool.map(concurrency.square_array, np.array_split(array, n_processes))
+            result = np.concatenate(chunks)
+            duration_pickled = time.perf_counter() - start
+            assert np.array_equal(result[idx], expected)
+            del chunks, result
+
+            start = time.perf_counter()
+            result = concurrency.shared_memory_square(pool, array)
+            duration_shared = time.perf_counter() - start
+            assert np.array_equal(result[idx], expected)
+            del result, array
+
+            speedup = duration_pickled / duration_shared
+            print(f'{size_mb:>5} MB | {duration_pickled:>8.3f}s | {duration_shared:>8.3f}s | {speedup:>6.1f}x')
+
+def benchmark_workloads(args: argparse.Namespace):
+    '''Speedup and efficiency of each workload across executors and worker counts'''
+    results = []
+    for workload in args.workloads:
+        func, is_async = get_workload(workload, args)
+        executors = ['asyncio'] if is_async else [x for x in args.executors if x != 'asyncio']
+        # Baseline is one worker (sync for blocking workloads)
+        baseline = [('asyncio', 1)] if is_async else [('sync', 1)]
+        configs = baseline + [
+            (executor, n) for executor in executors for n in args.n_workers
+            if executor != 'sync' and (executor, n) not in baseline
+        ]
+        for executor, n_workers in configs:
+            durations = time_workload(
+                func, executor, n_workers, args.n_tasks, args.warmup, args.repeat
+            )
+            results.append({
+                'workload'   : workload,
+                'executor'   : executor,
+                'n_workers'  : n_workers,
+                'n_tasks'    : args.n_tasks,
+                'durations_s': durations,
+                'min_s'      : min(durations),
+                'median_s'   : statistics.median(durations),
+            })
+    add_speedups(results)
+
+    for workload in args.workloads:
+        print(speedup_table_str(workload, [r for r in results if r['workload'] == workload]))
+    best = best_configs(results)
+    print('Best configuration per workload (by median time)')
+    for workload, result in best.items():
+        print(f'  {workload:5} : {result["executor"]} x {result["n_workers"]} '
+              f'({result["speedup"]:.2f}x speedup)')
+
+    if args.json:
+        report = {
+            'system' : {
+                'python'   : platform.python_version(),
+                'platform' : platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'config' : {
+                'n_tasks'   : args.n_tasks,
+                'warmup'    : args.warmup,
+                'repeat'    : args.repeat,
+                'cpu_loops' : args.cpu_loops,
+                'io_delay_s': concurrency.slow_io_delay,
+            },
+            'results' : results,
+            'best'    : {w: {'executor': r['executor'], 'n_workers': r['n_workers']} for w, r in best.items()},
+        }
+        with open(args.json, 'w') as ofile:
+            json.dump(report, ofile, indent=2)
+        print(f'Wrote report to {args.json}')
+
+def benchmark_contention(args: argparse.Namespace):
+    '''Increments/s of a Lock guarded counter vs ShardedCounter across thread counts'''
+    n_adds = args.n_adds
+    print(f'Counter increments/s with {n_adds:,} increments per thread')
+    counter_classes = (concurrency.LockedCounter, concurrency.ShardedCounter)
+    print(f'{"threads":>7} | ' + ' | '.join(f'{c.__name__:>14}' for c in counter_classes) + f' | {"speedup":>7}')
+    for n_threads in args.n_threads:
+        rates = []
+        for counter_class in counter_classes:
+            counter = counter_class()
+            start_barrier = threading.Barrier(n_threads + 1)
+            def add_many():
+                add = counter.add
+                start_barrier.wait()
+                for _ in range(n_adds):
+                    add()
+            threads = [threading.Thread(target=add_many) for _ in range(n_threads)]
+            for thread in threads:
+                thread.start()
+            start_barrier.wait()
+            start = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            duration = time.perf_counter() - start
+            assert counter.value() == n_threads * n_adds
+            rates.append(n_threads * n_adds / duration)
+        print(f'{n_threads:>7} | ' + ' | '.join(f'{r:>14,.0f}' for r in rates) + f' | {rates[1] / rates[0]:>6.2f}x')
+
+def benchmark_vectorized(args: argparse.Namespace):
+    '''Pure Python vs NumPy CPU kernels, with and without a process pool'''
+    n_processes = args.n_processes
+    sizes = [10**e for e in range(4, 10) if 10**e <= args.max_n]
+    kernels = {
+        'double' : (concurrency.double_range, concurrency.double_range_vectorized),
+        'square' : (concurrency.square_range, concurrency.square_range_vectorized),
+    }
+    with multiprocessing.Pool(n_processes) as pool:
+        pool.map(concurrency.just_print, range(n_processes)) # Spawn workers
+        for name, (python_kernel, numpy_kernel) in kernels.items():
+            print(f'Wall time of the {name}_range kernels ({n_processes} processes for mp)')
+            print(f'{"n":>11} | {"python":>9} | {"python+mp":>9} | {"numpy":>9} | {"numpy+mp":>9} | {"mp gain (numpy)":>15}')
+            for n in sizes:
+                candidates = {
+                    'python'    : lambda: python_kernel(0, n),
+                    'python+mp' : lambda: concurrency.parallel_range(pool, python_kernel, n),
+                    'numpy'     : lambda: numpy_kernel(0, n),
+                    'numpy+mp'  : lambda: concurrency.parallel_range(pool, numpy_kernel, n),
+                }
+                durations = {}
+                results = set()
+                for candidate, run in candidates.items():
+                    start = time.perf_counter()
+                    results.add(run())
+                    durations[candidate] = time.perf_counter() - start
+                assert len(results) == 1, f'Kernels disagree: {results}'
+                mp_gain = durations['numpy'] / durations['numpy+mp']
+                print(f'{n:>11,} | ' + ' | '.join(f'{d:>8.4f}s' for d in durations.values()) + f' | {mp_gain:>14.2f}x')
+            print()
+
+BENCHMARKS = {
+    'shared_memory' : benchmark_shared_memory,
+    'workloads'     : benchmark_workloads,
+    'contention'    : benchmark_contention,
+    'vectorized'    : benchmark_vectorized,
+}
+
+################################################################################
+# Workload harness
+WORKLOADS = ('cpu', 'io', 'aio')
+EXECUTORS = ('sync', 'thread', 'process', 'asyncio')
+
+def get_workload(workload: str, args: argparse.Namespace) -> tuple[Callable, bool]:
+    '''Task function for the workload and whether it is a coroutine function'''
+    if workload == 'cpu':
+        return functools.partial(concurrency.slow_cpu_process, n_loops=args.cpu_loops), False
+    elif workload == 'io':
+        return concurrency.slow_io_process, False
+    elif workload == 'aio':
+        return concurrency.slow_aio_process, True
+    raise ValueError(f'Unknown workload: {workload}')
+
+def time_workload(
+    func      : Callable,
+    executor  : str,
+    n_workers : int,
+    n_tasks   : int,
+    warmup    : int,
+    repeat    : int,
+) -> list[float]:
+    '''Durations of running n_tasks on the executor after warmup runs
+
+    Thread and process pools are created once per configuration so their
+    startup cost only counts towards the warmup runs.
+    '''
+    inputs = list(range(n_tasks))
+    with make_executor(executor, n_workers) as pool, devnull_stdout():
+        durations = []
+        for i in range(warmup + repeat):
+            start = time.perf_counter()
+            run_tasks(func, executor, pool, n_workers, inputs)
+            if i >= warmup:
+                durations.append(time.perf_counter() - start)
+    return durations
+
+def make_executor(executor: str, n_workers: int) -> contextlib.AbstractContextManager:
+    if executor == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+    elif executor == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=n_workers)
+    elif executor in ('sync', 'asyncio'):
+        return contextlib.nullcontext()
+    raise ValueError(f'Unknown executor: {executor}')
+
+def run_tasks(
+    func      : Callable,
+    executor  : str,
+    pool      : Optional[concurrent.futures.Executor],
+    n_workers : int,
+    inputs    : list[Any],
+) -> list[Any]:
+    if executor == 'sync':
+        return [func(x) for x in inputs]
+    elif executor == 'asyncio':
+        return asyncio.run(gather_bounded(func, inputs, n_workers))
+    return list(pool.map(func, inputs))
+
+async def gather_bounded(func: Callable, inputs: list[Any], n_workers: int) -> list[Any]:
+    return [x async for x in concurrency.bounded_map(func, inputs, n_workers)]
+
+def add_speedups(results: list[dict]):
+    '''Add speedup and efficiency relative to each workload's first (baseline) result'''
+    baselines = {}
+    for result in results:
+        baseline = baselines.setdefault(result['workload'], result['median_s'])
+        result['speedup'] = baseline / result['median_s']
+        result['efficiency'] = result['speedup'] / result['n_workers']
+
+def best_configs(results: list[dict]) -> dict[str, dict]:
+    best = {}
+    for result in results:
+        workload = result['workload']
+        if workload not in best or result['median_s'] < best[workload]['median_s']:
+            best[workload] = result
+    return best
+
+def speedup_table_str(workload: str, results: list[dict]) -> str:
+    n_workers = sorted({r['n_workers'] for r in results})
+    executors = list(dict.fromkeys(r['executor'] for r in results))
+    cells = {(r['executor'], r['n_workers']): r for r in results}
+
+    ostr = f'Workload {workload!r}: median time, speedup and efficiency vs one worker\n'
+    ostr += f'{"executor":>8} | ' + ' | '.join(f'{n:>3} workers{"":12}' for n in n_workers) + '\n'
+    for executor in executors:
+        row = []
+        for n in n_workers:
+            result = cells.get((executor, n))
+            if result is None:
+                row.append(f'{"-":>23}')
+            else:
+                row.append(
+                    f'{result["median_s"]:6.3f}s {result["speedup"]:5.2f}x {result["efficiency"]:6.0%}'
+                )
+        ostr += f'{executor:>8} | ' + ' | '.join(row) + '\n'
+    return ostr
+
+################################################################################
+# Utilities
+@contextlib.contextmanager
+def devnull_stdout():
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+################################################################################
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'benchmarks',
+        nargs = '*',
+        help  = f'Benchmarks to run (default: all). Options: {", ".join(BENCHMARKS)}',
+    )
+    parser.add_argument('--n-processes', type=int, default=concurrency.n_processors)
+    parser.add_argument('--max-mb', type=int, default=1024, help='Largest array size for shared_memory')
+
+    workloads = parser.add_argument_group('workloads benchmark')
+    workloads.add_argument('--workloads', nargs='+', choices=WORKLOADS, default=list(WORKLOADS))
+    workloads.add_argument('--executors', nargs='+', choices=EXECUTORS, default=list(EXECUTORS))
+    workloads.add_argument('--n-workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    workloads.add_argument('--n-tasks', type=int, default=8, help='Tasks per timed run')
+    workloads.add_argument('--warmup', type=int, default=1, help='Untimed runs per configuration')
+    workloads.add_argument('--repeat', type=int, default=3, help='Timed runs per configuration')
+    workloads.add_argument('--cpu-loops', type=int, default=2 * 10**6, help='Loop size of slow_cpu_process')
+    workloads.add_argument('--json', help='Path to write a JSON report to')
+
+    contention = parser.add_argument_group('contention benchmark')
+    contention.add_argument('--n-threads', type=int, nargs='+', default=[2, 4, 8, 16, 32, 64])
+    contention.add_argument('--n-adds', type=int, default=100_000, help='Increments per thread')
+
+    vectorized = parser.add_argument_group('vectorized benchmark')
+    vectorized.add_argument('--max-n', type=int, default=10**6, help='Largest kernel range size (the pure Python kernels build a list of this size)')
+
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'Unknown benchmark(s): {", ".join(sorted(unknown))}')
+    return args
+
+def main():
+    args = get_args()
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args)
+
+if __name__ == '__main__':
+    main()
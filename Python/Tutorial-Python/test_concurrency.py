@@ -0,0 +1,52 @@
+import asyncio
+import collections
+import operator
+import threading
+
+import pytest
+
+import concurrency
+
+################################################################################
+# AsyncFileWriter
+def test_async_file_writer_close_with_full_queue_and_failed_writer(tmp_path):
+    async def main():
+        writer = concurrency.AsyncFileWriter(tmp_path / 'out.txt', max_queued=1)
+        await writer.open()
+        failing = threading.Event()
+        def _write(text):
+            failing.wait()
+            raise OSError('disk full')
+        writer._write = _write
+        await writer.write('a')
+        # Queued while the writer task is stuck writing 'a', filling the queue
+        await writer.write('b')
+        assert writer._queue.full()
+        failing.set()
+        await asyncio.wait_for(writer.close(), timeout=5)
+
+    with pytest.raises(OSError, match='disk full'):
+        asyncio.run(main())
+
+################################################################################
+# ShardedAccumulator
+def test_sharded_accumulator_value_with_mutable_state_under_writers():
+    acc = concurrency.ShardedAccumulator(collections.Counter, operator.add)
+    n_threads = 4
+    n_adds = 20_000
+    start_barrier = threading.Barrier(n_threads + 1)
+    def add_keys():
+        start_barrier.wait()
+        for i in range(n_adds):
+            with acc.updating() as counts:
+                # New keys keep resizing the Counter while value() merges it
+                counts[i] += 1
+    threads = [threading.Thread(target=add_keys) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    while any(thread.is_alive() for thread in threads):
+        acc.value()
+    for thread in threads:
+        thread.join()
+    assert acc.value() == collections.Counter({i: n_threads for i in range(n_adds)})
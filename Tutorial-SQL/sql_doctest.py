@@ -3,17 +3,35 @@
 # Standard library
 from pathlib import Path
 import sqlite3
-from sqlite3 import OperationalError
 from time import perf_counter_ns
-from typing import Iterable
+from typing import Any, Iterable, Iterator
+from contextlib import closing
 import logging
 import difflib
 import argparse
 import itertools
+import collections
+import re
+import concurrent.futures
+import tempfile
 
 # Globals
 log = logging.getLogger('doctest')
 
+# RAISES answers (e.g. "(OperationalError, 'no such table: t')") are eval'd in
+# this module's globals
+OperationalError = sqlite3.OperationalError
+
+# Minimum tests per segment when running in parallel (see iterate_segments)
+MIN_SEGMENT_TESTS = 50
+
+# Setup statements whose effects are not captured by snapshot_db: connection
+# state, or changes outside the database (e.g. writing to an ATTACHed file or
+# VACUUM INTO a file) that must not be run twice
+CONNECTION_STATE_RE = re.compile(
+    r'\b(?:TEMP|TEMPORARY|ATTACH|DETACH|PRAGMA|VACUUM)\b', re.IGNORECASE
+)
+
 ################################################################################
 def main():
     args = parse_argv()
@@ -23,17 +41,26 @@ def main():
         format = "%(message)s",
         force  = True,
     )
-    with args.path.open('r') as fp:
-        lines = fp.readlines()
-
     n_failures = 0
     n_passed = 0
     n_skipped = 0
     query_durations = {}
     i = 0
-    with sqlite3.connect(':memory:') as conn:
-        cur = conn.cursor()
-        for i, (sql_script, test_query, answer, test_type) in enumerate(iterate_tests(lines)):
+    with args.path.open('r') as fp:
+        tests = iterate_tests(fp)
+        if args.jobs > 1:
+            outcomes = run_tests_parallel(tests, args.jobs, args.min_segment_tests)
+        else:
+            outcomes = run_tests(tests)
+
+        for i, outcome in enumerate(outcomes):
+            sql_script = outcome['sql_script']
+            test_query = outcome['test_query']
+            answer     = outcome['answer']
+            test_type  = outcome['test_type']
+            result     = outcome['result']
+            elapsed    = outcome['elapsed']
+
             # DEBUG
             if any(l and not l.startswith('--') for l in sql_script.split('\n')):
                 log.debug('\n==== SETUP =====')
@@ -53,35 +80,20 @@ def main():
             # else:
             #     log.error('Unable to determine test type')
 
-            # Run any setup statements
-            if sql_script:
-                try:
-                    cur.executescript(sql_script)
-                except OperationalError:
+            # Errors from running the setup statements or test query
+            if outcome['error'] is not None:
+                if outcome['error_in'] == 'setup':
                     log.critical(f'Exception running SQL setup commands:\n{sql_script}')
-                    raise
-
-            # Run test query
-            elapsed = 0
-            try:
-                start = perf_counter_ns()
-                result = cur.execute(test_query).fetchall()
-                elapsed = perf_counter_ns() - start
-                query_durations[(i, test_query)] = elapsed
-            except sqlite3.OperationalError as e:
-                if test_type == 'RAISES':
-                    # NOTE: Exceptions cannot be checked for equality so they
-                    # need to have their type and str compared separately
-                    result = (type(e), str(e))
                 else:
                     log.critical(f'Exception running SQL query:\n{test_query}')
-                    raise
+                raise outcome['error']
+            if test_type != 'RAISES' or not isinstance(result, tuple):
+                query_durations[(i, test_query)] = elapsed
 
             # Check answer
             if test_type == 'DEBUG':
                 print(f'sqlite3> {test_query.strip()}')
-                headers = tuple(x[0] for x in cur.description)
-                print_tuple_table(result, headers)
+                print_tuple_table(result, outcome['headers'])
                 print(f'{elapsed/10**3}ms')
                 print()
             elif answer is None:
@@ -126,15 +138,177 @@ def main():
     else:
         log.info(f'🟨 {n_passed}/{n_tests} tests passed!')
 
-def iterate_tests(lines):
+def run_tests(tests: Iterable[tuple], conn: sqlite3.Connection | None = None) -> Iterator[dict]:
+    """Run each (sql_script, test_query, answer, test_type) and yield its outcome
+
+    Outcomes are plain dicts so they can be returned from worker processes.
+    Running stops after the first outcome with an error.
+    """
+    if conn is None:
+        conn = sqlite3.connect(':memory:')
+    with conn:
+        cur = conn.cursor()
+        for sql_script, test_query, answer, test_type in tests:
+            outcome = {
+                'sql_script' : sql_script,
+                'test_query' : test_query,
+                'answer'     : answer,
+                'test_type'  : test_type,
+                'result'     : None,
+                'elapsed'    : 0,
+                'headers'    : None,
+                'error'      : None,
+                'error_in'   : None,
+            }
+
+            # Run any setup statements
+            if sql_script:
+                try:
+                    cur.executescript(sql_script)
+                except sqlite3.Error as e:
+                    outcome.update(error=e, error_in='setup')
+                    yield outcome
+                    return
+
+            # Run test query
+            try:
+                start = perf_counter_ns()
+                outcome['result'] = cur.execute(test_query).fetchall()
+                outcome['elapsed'] = perf_counter_ns() - start
+            except sqlite3.OperationalError as e:
+                if test_type == 'RAISES':
+                    # NOTE: Exceptions cannot be checked for equality so they
+                    # need to have their type and str compared separately
+                    outcome['result'] = (type(e), str(e))
+                else:
+                    outcome.update(error=e, error_in='query')
+                    yield outcome
+                    return
+            if test_type == 'DEBUG':
+                outcome['headers'] = tuple(x[0] for x in cur.description)
+            yield outcome
+
+################################################################################
+# Parallel test runs
+# Tests share one database so each test sees the state left by every setup
+# script before it. To run them in parallel the tests are split into segments
+# of min_segment_tests and each segment starts from a snapshot of the database
+# taken just before its first test. The main process runs the setup scripts
+# to produce the snapshots while workers rerun them along with the (slow) test
+# queries. This assumes test queries (SELECT/VALUES/WITH) do not modify the
+# database. Snapshots only hold the main database, so once a setup script
+# matches CONNECTION_STATE_RE (TEMP objects, ATTACHed databases, PRAGMAs,
+# VACUUM INTO) the main process stops running setup scripts and the rest of
+# the file runs as one segment. Setup is then only run once, by the worker,
+# which matters when it changes files outside the database (e.g. INSERT into
+# an ATTACHed file).
+def run_tests_parallel(
+    tests             : Iterable[tuple],
+    n_jobs            : int,
+    min_segment_tests : int = MIN_SEGMENT_TESTS,
+) -> Iterator[dict]:
+    """Same outcomes as run_tests (in test order) with segments run in n_jobs processes"""
+    with sqlite3.connect(':memory:') as conn, \
+            concurrent.futures.ProcessPoolExecutor(n_jobs) as executor:
+        # Bound in flight segments so the file is still read lazily
+        futures = collections.deque()
+        for snapshot, segment in iterate_segments(conn, tests, min_segment_tests):
+            futures.append(executor.submit(run_segment, snapshot, segment))
+            while len(futures) > 2 * n_jobs:
+                yield from futures.popleft().result()
+        while futures:
+            yield from futures.popleft().result()
+
+def iterate_segments(
+    conn              : sqlite3.Connection,
+    tests             : Iterable[tuple],
+    min_segment_tests : int = MIN_SEGMENT_TESTS,
+) -> Iterator[tuple[bytes, list[tuple]]]:
+    """Split tests into (snapshot, tests) segments that can run independently
+
+    A new segment starts once the current one has min_segment_tests tests,
+    until a setup script changes state a snapshot cannot carry (see
+    CONNECTION_STATE_RE). That script is not run here and the remaining tests
+    form the last segment. conn is advanced by running the other setup scripts.
+    """
+    cur = conn.cursor()
+    snapshot = snapshot_db(conn)
+    db_changed = False
+    segment = []
+    tests = iter(tests)
+    for test in tests:
+        if len(segment) >= min_segment_tests:
+            yield snapshot, segment
+            if db_changed:
+                snapshot = snapshot_db(conn)
+                db_changed = False
+            segment = []
+        segment.append(test)
+        sql_script = test[0]
+        setup_lines = [l for l in sql_script.split('\n') if l and not l.startswith('--')]
+        if not setup_lines:
+            continue
+        if any(CONNECTION_STATE_RE.search(l) for l in setup_lines):
+            # Only the worker runs this and later setup scripts
+            segment.extend(tests)
+            break
+        try:
+            cur.executescript(sql_script)
+        except sqlite3.Error:
+            # The worker hits the same error and reports it in order
+            break
+        db_changed = True
+    if segment:
+        yield snapshot, segment
+
+def run_segment(snapshot: bytes, tests: list[tuple]) -> list[dict]:
+    return list(run_tests(tests, restore_db(snapshot)))
+
+def snapshot_db(conn: sqlite3.Connection) -> bytes:
+    if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+        # Nothing created yet (and SQLite cannot serialize an empty database)
+        return b''
+    if hasattr(conn, 'serialize'):
+        return conn.serialize()
+    # Python < 3.11 or SQLite built without serialize support
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'snapshot.db'
+        with closing(sqlite3.connect(path)) as dst:
+            conn.backup(dst)
+        return path.read_bytes()
+
+def restore_db(snapshot: bytes) -> sqlite3.Connection:
+    conn = sqlite3.connect(':memory:')
+    if not snapshot:
+        return conn
+    if hasattr(conn, 'deserialize'):
+        conn.deserialize(snapshot)
+        return conn
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'snapshot.db'
+        path.write_bytes(snapshot)
+        with closing(sqlite3.connect(path)) as src:
+            src.backup(conn)
+    return conn
+
+################################################################################
+def iterate_tests(lines: Iterable[str]) -> Iterator[tuple[str, str, Any, str | None]]:
+    """Yield (sql_script, test_query, answer, test_type) for each query
+
+    lines can be any iterable (e.g. an open file) and is read lazily so only
+    the lines of the current setup script and query are kept in memory.
+    """
     in_comment   = False
     in_statement = False
-    i_script     = 0
-    i_query      = None
+    block        = [] # Lines since the end of the last test
+    i_query      = None # Start of query in block
 
-    i = -1
-    while (i := i+1) < len(lines):
-        line = lines[i].split('--', maxsplit=1)[0].strip()
+    lines = iter(lines)
+    next_line = next(lines, None)
+    while next_line is not None:
+        raw_line, next_line = next_line, next(lines, None)
+        block.append(raw_line)
+        line = raw_line.split('--', maxsplit=1)[0].strip()
 
         if line == '':
             continue
@@ -153,7 +327,7 @@ def iterate_tests(lines):
             in_statement = True
             statement_type = line.split(maxsplit=1)[0].upper()
             if statement_type in {'SELECT', 'VALUES', 'WITH'}:
-                i_query = i
+                i_query = len(block) - 1
 
         # Handle end of SQL statement
         if line.endswith(';'):
@@ -162,24 +336,23 @@ def iterate_tests(lines):
                 continue
 
             # Extract script setup and query
-            sql_script = ''.join(lines[i_script:i_query])
-            sql_query  = ''.join(lines[i_query:i+1])
+            sql_script = ''.join(block[:i_query])
+            sql_query  = ''.join(block[i_query:])
 
             # Parse answer
             test_keyword = None
             for keyword in ['EQUALS', 'RAISES', 'DEBUG']:
-                if lines[i+1].startswith(f'-- {keyword}'):
+                if next_line is not None and next_line.startswith(f'-- {keyword}'):
                     test_keyword = keyword
                     break
 
             answer = None
             if test_keyword is not None and test_keyword != 'DEBUG':
-                i += 1
-
-                answer_lines = [lines[i][len(f'-- {test_keyword}'):].strip()]
-                while i+1 < len(lines) and lines[i+1].startswith('--'):
-                    i += 1
-                    answer_lines.append(lines[i][len('--'):].strip())
+                answer_lines = [next_line[len(f'-- {test_keyword}'):].strip()]
+                next_line = next(lines, None)
+                while next_line is not None and next_line.startswith('--'):
+                    answer_lines.append(next_line[len('--'):].strip())
+                    next_line = next(lines, None)
                 answer_str = '\n'.join(answer_lines)
 
                 if test_keyword == "EQUALS":
@@ -189,7 +362,7 @@ def iterate_tests(lines):
             yield sql_script, sql_query, answer, test_keyword
 
             # Reset trackers
-            i_script = i+1
+            block = []
             i_query = None
 
 ################################################################################
@@ -315,6 +488,19 @@ def parse_argv() -> argparse.Namespace:
         default = 'INFO',
         help    = "Root logging level",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type    = int,
+        default = 1,
+        help    = "Processes to run tests in. Tests are split at setup scripts",
+    )
+    parser.add_argument(
+        "--min-segment-tests",
+        type    = int,
+        default = MIN_SEGMENT_TESTS,
+        help    = "Minimum tests per segment with --jobs > 1",
+    )
     return parser.parse_args()
 
 if __name__ == '__main__':
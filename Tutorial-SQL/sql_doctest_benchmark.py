@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Benchmarks for sql_doctest.py
+
+Run as
+>> python3 sql_doctest_benchmark.py                # 1 GB synthetic test file
+>> python3 sql_doctest_benchmark.py --size-mb 100
+
+Only parsing is timed (not running the queries). Each parser runs in a fresh
+process so its peak RSS is not affected by the other parser.
+"""
+# Standard library
+from pathlib import Path
+from time import perf_counter
+import argparse
+import concurrent.futures
+import multiprocessing
+import resource
+import tempfile
+
+# Project
+import sql_doctest
+
+################################################################################
+def main():
+    args = parse_argv()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'synthetic.sql'
+        n_blocks = write_synthetic_tests(path, args.size_mb * 2**20)
+        size_mb = path.stat().st_size / 2**20
+        print(f'Parsing {size_mb:,.0f} MB synthetic test file ({n_blocks:,} setup blocks)')
+
+        results = {}
+        for parser in ('readlines', 'streaming'):
+            # Fresh spawned process per parser so ru_maxrss is its own peak
+            context = multiprocessing.get_context('spawn')
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+                results[parser] = executor.submit(time_parser, parser, path).result()
+
+        print(f'{"parser":>10} | {"tests":>9} | {"time":>8} | {"tests/s":>9} | {"peak RSS":>9}')
+        for name, (n_tests, duration, max_rss_mb) in results.items():
+            print(f'{name:>10} | {n_tests:>9,} | {duration:>7.2f}s | {n_tests/duration:>9,.0f} | {max_rss_mb:>6,.0f} MB')
+        n_tests = {n for n, _, _ in results.values()}
+        assert len(n_tests) == 1, f'Parsers found different numbers of tests: {n_tests}'
+
+def time_parser(parser: str, path: Path) -> tuple[int, float, float]:
+    """Parse every test in path and return (n_tests, duration, peak RSS in MB)"""
+    start = perf_counter()
+    with path.open('r') as fp:
+        if parser == 'readlines':
+            tests = iterate_tests_readlines(fp.readlines())
+        else:
+            tests = sql_doctest.iterate_tests(fp)
+        n_tests = sum(1 for _ in tests)
+    duration = perf_counter() - start
+    # ru_maxrss is in KB on Linux
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    return n_tests, duration, max_rss_mb
+
+def write_synthetic_tests(path: Path, size_bytes: int) -> int:
+    """Write repeated setup + test blocks until the file reaches size_bytes"""
+    n_blocks = 0
+    with path.open('w') as ofile:
+        while ofile.tell() < size_bytes:
+            ofile.write(synthetic_block(n_blocks))
+            n_blocks += 1
+    return n_blocks
+
+def synthetic_block(i: int) -> str:
+    return (
+        f"/* Fixture {i} */\n"
+        f"DROP TABLE IF EXISTS t{i % 100};\n"
+        f"CREATE TABLE t{i % 100} (id INTEGER PRIMARY KEY, name TEXT, score REAL);\n"
+        f"INSERT INTO t{i % 100} VALUES\n"
+        f"    (1, 'a{i}', {i}.5),\n"
+        f"    (2, NULL, NULL);\n"
+        f"\n"
+        f"SELECT id, name FROM t{i % 100} -- Comment\n"
+        f"ORDER BY id;\n"
+        f"-- EQUALS\n"
+        f"-- [(1, 'a{i}'),\n"
+        f"--  (2, NULL)]\n"
+        f"SELECT count(*) FROM t{i % 100};\n"
+        f"-- EQUALS [(2,)]\n"
+        f"SELECT * FROM missing_{i};\n"
+        f"-- RAISES (OperationalError, 'no such table: missing_{i}')\n"
+        f"\n"
+    )
+
+################################################################################
+def iterate_tests_readlines(lines: list[str]):
+    """Original sql_doctest.iterate_tests that indexes into all lines of the file"""
+    in_comment   = False
+    in_statement = False
+    i_script     = 0
+    i_query      = None
+
+    i = -1
+    while (i := i+1) < len(lines):
+        line = lines[i].split('--', maxsplit=1)[0].strip()
+
+        if line == '':
+            continue
+
+        # Skip comments
+        if line.startswith('/*'):
+            in_comment = True
+        if line.endswith('*/'):
+            in_comment = False
+            continue
+        if in_comment:
+            continue
+
+        # Flag start of SQL statement
+        if not in_statement:
+            in_statement = True
+            statement_type = line.split(maxsplit=1)[0].upper()
+            if statement_type in {'SELECT', 'VALUES', 'WITH'}:
+                i_query = i
+
+        # Handle end of SQL statement
+        if line.endswith(';'):
+            in_statement = False
+            if i_query is None:
+                continue
+
+            # Extract script setup and query
+            sql_script = ''.join(lines[i_script:i_query])
+            sql_query  = ''.join(lines[i_query:i+1])
+
+            # Parse answer
+            test_keyword = None
+            for keyword in ['EQUALS', 'RAISES', 'DEBUG']:
+                if lines[i+1].startswith(f'-- {keyword}'):
+                    test_keyword = keyword
+                    break
+
+            answer = None
+            if test_keyword is not None and test_keyword != 'DEBUG':
+                i += 1
+
+                answer_lines = [lines[i][len(f'-- {test_keyword}'):].strip()]
+                while i+1 < len(lines) and lines[i+1].startswith('--'):
+                    i += 1
+                    answer_lines.append(lines[i][len('--'):].strip())
+                answer_str = '\n'.join(answer_lines)
+
+                if test_keyword == "EQUALS":
+                    answer_str = answer_str.replace('NULL', 'None')
+                answer = eval(answer_str, vars(sql_doctest))
+
+            yield sql_script, sql_query, answer, test_keyword
+
+            # Reset trackers
+            i_script = i+1
+            i_query = None
+
+################################################################################
+def parse_argv() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--size-mb',
+        type    = int,
+        default = 1024,
+        help    = 'Size of the synthetic test file',
+    )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    main()